@@ -1,10 +1,17 @@
 import numpy as np
 import time
+import os
+import json
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from matplotlib.axes import Axes
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from collections.abc import Sequence
-from . import similarities
+from scipy import sparse
+from scipy.spatial import distance
+from . import similarities, initialization, engines, kernels, profiling, history
 
 def _is_array_like(input) -> bool:
     return isinstance(input, (np.ndarray, Sequence)) and not isinstance(input, str)
@@ -43,18 +50,18 @@ def _assert_input(var_name:str, input=None, check="int", *,
 
 def gradient(P:np.ndarray, Q:np.ndarray, y:np.ndarray,y_dist:np.ndarray) -> np.ndarray:
     # not_diag = np.expand_dims(~np.eye(P.shape[0], dtype=bool), axis=2)
-    pq = P-Q
-    np.fill_diagonal(pq, 0)
-
-    y_diff =  np.expand_dims(y,1)-np.expand_dims(y,0)
-    result = np.expand_dims(pq, 2) * y_diff * np.expand_dims(1/(1+y_dist), 2)
-    return 4 * result.sum(axis=1)
+    # sum_j w_ij*(y_i-y_j) = y_i*sum_j w_ij - (w@y)_i, sin el array de diferencias de (n, n, n_dimensions)
+    w = P-Q
+    w /= 1+y_dist
+    np.fill_diagonal(w, 0)
+    return 4 * (y*w.sum(axis=1, keepdims=True, dtype=np.float64) - w@y).astype(y.dtype, copy=False)
 def kl_divergence(P, Q) -> float:
     """Computes the Kullback-Leibler divergence
     Parameters
     ----------
         high_dimension_p: ndarray of shape (n_samples, n_samples)
             The joint probabilities for the samples in the original dimension.
+            It can also be condensed, in which case so must be Q, and each pair is counted twice.
 
         low_dimension_p: ndarray of shape (n_samples, n_samples)
             The joint probabilities for the samples embedded in the lower dimension.
@@ -65,7 +72,12 @@ def kl_divergence(P, Q) -> float:
             The divergence.
     """
     cond = P!=0.
-    return np.sum(P*np.log(P/Q, where=cond), where=cond)
+    result = np.sum(P*np.log(P/Q, where=cond), where=cond, dtype=np.float64)
+    return 2*result if np.ndim(P)==1 else result
+
+def _spread(embed) -> float:
+    # Raiz de la distancia cuadratica media de las muestras a su media
+    return float(np.sqrt(np.square(embed-embed.mean(axis=0)).sum(axis=1).mean()))
 
 class TSne():
     """Class for performing the T-Sne embedding.
@@ -81,9 +93,13 @@ class TSne():
     init : str or Array-Like of shape (n_samples, n_dimensions), default='random'
         If Array-Like, the starting embedding of the input data.
         If str, the method for obtaining it from the input data.
-        Only supported methods currently are 'pca' and 'random'.
+        Only supported methods currently are 'pca', 'spectral' and 'random'.
         
-        Note: to use init='pca', the animatsne must be installed with the [pca] option enabled, by running the command 'pip install animatsne[pca]'
+        With init='pca', the principal components are obtained with a randomized SVD seeded with seed,
+        and rescaled so that the first one has a standard deviation of 1e-4.
+
+        With init='spectral', the starting embedding is the Laplacian eigenmap of the affinity graph P,
+        rescaled in the same way. It starts already untangled, so fewer iterations are needed.
     
     perplexity : int or float, default=30
         The perplexity represents the number of nearest neighbors
@@ -127,18 +143,111 @@ class TSne():
         In the second phase, the early exaggeration is turned off
         and the momentum function takes the value ending_momentum
     
+    adaptive_gains : bool, default=True
+        If True, each coordinate of the embedding has its own gain on the learning rate (delta-bar-delta).
+        The gain of a coordinate grows by 0.2 while its gradient keeps the direction of the previous update,
+        and shrinks by a factor of 0.8 when it changes direction.
+        If False, every coordinate uses learning_rate as is.
+    
+    min_gain : float, default=0.01
+        Minimum value of the gains when adaptive_gains is True.
+        Must be greater than 0.
+    
     n_iter : int, default=1000
-        Number of iterations to run, and number of frames in the animation.
+        Maximum number of iterations to run, and of frames in the animation.
         Must be at least 10
     
     iters_check : int, default=50
         The cost function will be computed every iters_check iterations.
         Must be at least 1 and at most n_iter.
     
+    min_grad_norm : float, default=1e-7
+        Once past momentum_threshold, the descent stops early
+        if the norm of the gradient falls below this value.
+        Must be at least 0. If 0, this criterion is disabled.
+    
+    n_iter_without_progress : int or None, default=300
+        Once past momentum_threshold, the descent stops early if the cost
+        has not improved for this many iterations.
+        The cost is only checked every iters_check iterations.
+        Must be at least 1. If None, this criterion is disabled.
+    
     seed : int, default=None
         Value to seed the rng Generator through numpy.
         If None is given, the system time will be used for the seed.
     
+    checkpoint_path : str or None, default=None
+        File where the state of the descent is saved every checkpoint_every iterations,
+        in numpy's .npz format. The affinities P are saved once per fit next to it,
+        in a file with the same name ending in '_p.npy'.
+        The descent can be continued from the checkpoint with resume.
+        If None, no checkpoints are written.
+    
+    checkpoint_every : int, default=500
+        Number of iterations between checkpoints. Must be at least 1.
+    
+    n_restarts : int, default=1
+        Number of independent descents run by fit, with seeds seed, seed+1, ...
+        They run concurrently in a pool of processes, sharing P, and the one with
+        the lowest final cost is kept. Only meaningful with init='random'.
+        Checkpoints are not written when n_restarts>1.
+        With the numba backend, or once any compiled kernel has run in the process (for example,
+        in an earlier fit with backend='auto'), the processes are started with 'spawn', so the
+        script that calls fit must run it inside an if __name__=="__main__": block.
+        Must be at least 1.
+    
+    n_jobs : int or None, default=None
+        Number of threads used by the 'exact' engine, which computes the gradient by tiles of rows,
+        and number of processes used when n_restarts>1 (see n_restarts).
+        If None, the number of processors of the machine.
+    
+    engine : str, default='auto'
+        How P and the gradient are computed. One of 'auto', 'exact', 'sparse', 'fft' or 'sampling'.
+        
+        With 'exact', P and Q are dense, and memory grows with n_samples^2.
+        With 'sparse', P is computed from the 3*perplexity nearest neighbors of each sample,
+        and the repulsive forces are computed exactly by blocks of rows.
+        With 'fft', P is sparse too, and the repulsive forces are interpolated from a grid.
+        Only for 2 or 3 dimensions.
+        With 'sampling', P is sparse too, and both forces are estimated at random in each iteration:
+        the attractive ones from n_negatives edges of P per sample, and the repulsive ones from n_negatives other samples.
+        It is the cheapest per iteration, for very large inputs, but the descent and the cost are noisy.
+        Its cost is estimated too, from the normalization of Q of the same draws (see cost_pairs for the cost outside the descent).
+        With 'auto', the first of 'exact', 'fft' and 'sparse' whose estimated peak memory fits in memory_limit is used.
+        Since it is stochastic, 'sampling' is never chosen by 'auto': it must be given explicitly.
+
+    n_negatives : int, default=20
+        Number of samples drawn per sample in each iteration by the 'sampling' engine.
+        Must be at least 1.
+    
+    cost_pairs : int or None, default=None
+        With the engines with sparse P, the cost only needs the nonzero entries of P and the normalization of Q.
+        In the descent, that normalization comes from the gradient. When the cost is computed on its own,
+        like the initial cost or the final cost of sweep, it is estimated from cost_pairs random pairs of samples
+        instead of computing the repulsive forces, which needs time O(n_samples^2) with the 'sparse' engine.
+        If None, it is computed with the gradient. The 'exact' engine always computes the exact cost.
+        Must be at least 1.
+    
+    memory_limit : int, float or None, default=None
+        Memory budget for fit, in bytes. If the chosen engine needs more, fit raises a MemoryError
+        before allocating anything.
+        If None, the memory available in the system when fit is called.
+    
+    backend : str, default='auto'
+        Implementation of the kernels: the search of P, the gradient and the cost. One of 'auto', 'numpy' or 'numba'.
+        With 'numba', compiled and parallel versions of the kernels are used, which need numba to be installed.
+        With 'auto', 'numba' if it is installed, and 'numpy' otherwise.
+        The 'fft' engine only uses the compiled kernels for the search of P.
+    
+    dtype : data-type, default=np.float64
+        Precision of the distances, P, Q, the gradient and the embedding. Either np.float32 or np.float64.
+        With np.float32, memory use of the exact engine is halved. Sums over all the pairs of samples
+        are still accumulated in double precision.
+    
+    metrics_path : str or None, default=None
+        If not None, a JSONL file the metrics of every iteration, as recorded in history, are appended to,
+        one JSON object per line, in buffered writes. Values not computed in an iteration are written as null.
+    
     verbose : int, default=0
         Verbosity level (all levels include all info from previous levels).
         0 for no info, 1 for total execution time and time/iteration, 2 for evolution of the cost function
@@ -152,10 +261,17 @@ class TSne():
     cost : float
         Value of the cost function for the current embedding
     
-    cost_record : None or list[float]
-        Record of the evolution of the cost function.
+    cost_record : None or Mapping
+        Record of the evolution of the cost function, as a read-only dict-like view {iteration: cost} of history.
         None if fit has not been called or was called with record_cost=False
     
+    history : None or animatsne.history.History
+        Metrics of every iteration of the last descent. Its records are a structured array with the fields
+        'iteration', 'cost' (NaN where it is not computed, see iters_check), 'grad_norm', 'step_size'
+        (mean norm of the update of each sample), 'spread' (root mean square distance of the samples to their mean)
+        and 'time' (seconds since the previous row). The first row is the initial embedding.
+        None if the model has not been fitted.
+    
     embedding_record : None or list[ndarray]
         Record of the evolution of the embedding
         None if fit has not been called or was called with record_embed=False
@@ -163,6 +279,23 @@ class TSne():
     n_iter : int
         Number of iterations of t-SNE executed.
         Also the iteration of the final embedding.
+    
+    restart_costs : None or ndarray of shape (n_restarts,)
+        Final cost of each descent, when fit was called with n_restarts>1.
+        The one kept is at index argmin(restart_costs).
+    
+    engine_used : None or str
+        The engine used in the last fit, once engine='auto' has been resolved.
+        None if the model has not been fitted.
+    
+    timings_ : dict
+        Wall time spent in each phase of the last call to fit, resume, partial_fit or fit_sequence,
+        as a dict {phase: {'seconds': float, 'calls': int}}. The phases are 'validation' (of the input),
+        'distances' (or the search of nearest neighbors), 'sigma_search' (conditional probabilities),
+        'symmetrization' (of P, included in 'sigma_search' with the 'exact' engine), 'gradient'
+        (which computes Q implicitly), 'cost', 'rendering' (updating the plot) and 'encoding'
+        (drawing and writing the frames of the gif, when gif_filename is given).
+        For a profile of every function, see animatsne.profiling.profile.
     """
     def __init__(self, *,
                  n_dimensions=2,
@@ -175,13 +308,28 @@ class TSne():
                  starting_momentum=0.5,
                  ending_momentum=0.8,
                  momentum_threshold=250,
+                 adaptive_gains=True,
+                 min_gain=0.01,
                  n_iter=1000,
                  iters_check=50,
+                 min_grad_norm=1e-7,
+                 n_iter_without_progress:int=300,
                  seed:int=None,
+                 checkpoint_path:str=None,
+                 checkpoint_every=500,
+                 n_restarts=1,
+                 n_jobs:int=None,
+                 engine="auto",
+                 n_negatives=20,
+                 cost_pairs:int=None,
+                 memory_limit:int|float=None,
+                 backend="auto",
+                 dtype=np.float64,
+                 metrics_path:str=None,
                  verbose=0,
                  ):
         #===validacion de parametros=================================================================================
-        self.__init_validation(n_dimensions, perplexity, perplexity_tolerance, metric, init, early_exaggeration, learning_rate, n_iter, starting_momentum, ending_momentum, momentum_threshold, seed, verbose, iters_check)
+        self.__init_validation(n_dimensions, perplexity, perplexity_tolerance, metric, init, early_exaggeration, learning_rate, n_iter, starting_momentum, ending_momentum, momentum_threshold, adaptive_gains, min_gain, seed, verbose, iters_check, min_grad_norm, n_iter_without_progress, checkpoint_path, checkpoint_every, n_restarts, n_jobs, engine, n_negatives, cost_pairs, memory_limit, backend, dtype, metrics_path)
 
         #===inicializacion de la clase===============================================================================
         self._n_dimensions = n_dimensions if isinstance(n_dimensions, int) else int(np.floor(n_dimensions))
@@ -195,18 +343,41 @@ class TSne():
         self._learning_rate = learning_rate
         self.__lr = None
         self.n_iter = n_iter
+        self._max_iter = n_iter
+        self._min_grad_norm = min_grad_norm
+        self._n_iter_without_progress = n_iter_without_progress
         self._momentum_start = starting_momentum
         self._momentum_end = ending_momentum
         self._momentum_threshold = momentum_threshold
+        self._adaptive_gains = adaptive_gains
+        self._min_gain = min_gain
         self._early_exaggeration = 12. if early_exaggeration is None else early_exaggeration
         self._verbose = verbose
         self._iters_check = iters_check
         self._seed = int(time.time()) if seed is None else seed
         self._rng = np.random.default_rng(self._seed)
+        self._checkpoint_path = checkpoint_path
+        self._checkpoint_every = checkpoint_every
+        self._n_restarts = n_restarts
+        self._n_jobs = n_jobs
+        self._engine = engine.lower()
+        self._n_negatives = n_negatives
+        self._cost_pairs = cost_pairs
+        self._memory_limit = memory_limit
+        self._dtype = np.dtype(dtype)
+        self._metrics_path = metrics_path
+        self._backend = backend.lower()
+        if self._backend!="numpy" and not kernels.available():
+            if self._backend=="numba":
+                print("**Warning: numba is not installed, the numpy backend will be used**")
+            self._backend = "numpy"
+        elif self._backend=="auto":
+            self._backend = "numba"
 
         
         #=== Plotting Params
-        self._plotting_fig, self._plotting_ax = plt.subplots() if self._n_dimensions==2 else plt.subplots(subplot_kw=dict({"projection": "3d"}))
+        self._plotting_fig = None
+        self._plotting_ax = None
         self._plotting_labels = None
         self._plotting_colors = None
         self._plotting_markers = None
@@ -216,12 +387,34 @@ class TSne():
         #=== Auxiliary Params ====================================================================================
         self._best_iter = None
         self._best_cost = None
+        self._stop_iter = None
         self.cost = None
         self._init_embed = None
         self.embed = None
         self._update = None
+        self._gains = None
+        self._affinities_path = None
+        self._X = None
+        self._betas = None
+        self._knn_forest = None
+        self._knn_neighbors = None
+        self._knn_dists = None
+        self._knn_cond_p = None
+        self._labels = None
+        self._temporal_anchor = None
+        self._temporal_weight = 0.
+        self._moving = None
+        self._z_fixed = 0.
+        self.__pool = None
         self.embedding_record = None
         self.cost_record = None
+        self.history = None
+        self.restart_costs = None
+        self.engine_used = None
+        self._callbacks = []
+        self._callback_every = 1
+        self.__timer = profiling.PhaseTimer()
+        self.timings_ = self.__timer.phases
 
     def __init_validation(self,
                           n_dimensions,
@@ -235,9 +428,24 @@ class TSne():
                           starting_momentum,
                           ending_momentum,
                           momentum_threshold,
+                          adaptive_gains,
+                          min_gain,
                           seed,
                           verbose,
-                          iters_check):
+                          iters_check,
+                          min_grad_norm,
+                          n_iter_without_progress,
+                          checkpoint_path,
+                          checkpoint_every,
+                          n_restarts,
+                          n_jobs,
+                          engine,
+                          n_negatives,
+                          cost_pairs,
+                          memory_limit,
+                          backend,
+                          dtype,
+                          metrics_path):
 
         # N dimensions: int
         _assert_input("n_dimensions", n_dimensions, "int", more=1)
@@ -256,17 +464,13 @@ class TSne():
         # Init: numpy.ndarray
         if init is not None:
             if isinstance(init, str):
-                assert init.lower() in ["random", "pca"], "Only init_method values accepted are 'random', 'precomputed' and 'pca'"
+                assert init.lower() in ["random", "pca", "spectral"], "Only init_method values accepted are 'random', 'pca' and 'spectral'"
                 if metric is not None and init.lower()=="pca":
                     assert metric.lower()!="precomputed", "Init cannot be 'pca' when metric is 'precomputed'"
-                if init.lower=="pca":
-                    import importlib.util as imp_ut
-                    spec = imp_ut.find_spec("scikit-learn")
-                    assert spec is not None, "If you want to use pca initialization, install the scikit-learn package, or install animatsne with the [pca] option"
             elif _is_array_like(init):
                 init = np.array(init)
                 
-                assert isinstance(init.dtype, np.number), "Data type of the initial embedding must be a number"
+                assert np.issubdtype(init.dtype, np.number), "Data type of the initial embedding must be a number"
                 assert np.all(np.isfinite(init)), "The initial embedding must not contain NaN or an infinite number"
                 if n_dimensions is not None:
                     assert init.shape[1]==n_dimensions, "The initial embedding must have the number of dimensions provided"
@@ -296,6 +500,13 @@ class TSne():
         # Momentum threshold: float
         _assert_input("momentum_threshold", momentum_threshold, "int", within_range=range(n_iter))
         
+        # Adaptive gains: bool
+        if adaptive_gains is not None:
+            assert isinstance(adaptive_gains, bool), "adaptive_gains must be of bool type"
+        
+        # Min gain: float
+        _assert_input("min_gain", min_gain, "float", more=0.)
+        
         # seed: int
         _assert_input("seed", seed, "int", more_equal=0)
         
@@ -306,9 +517,52 @@ class TSne():
         
         # Verbose: int
         _assert_input("verbose", verbose, "int", more_equal=0)
+        
+        # Min grad norm: float
+        _assert_input("min_grad_norm", min_grad_norm, "float", more_equal=0.)
+        
+        # Iters without progress: int
+        _assert_input("n_iter_without_progress", n_iter_without_progress, "int", more_equal=1)
+        
+        # Checkpoint path: str
+        _assert_input("checkpoint_path", checkpoint_path, "str")
+        
+        # Checkpoint every: int
+        _assert_input("checkpoint_every", checkpoint_every, "int", more_equal=1)
+        
+        # Restarts: int
+        _assert_input("n_restarts", n_restarts, "int", more_equal=1)
+        
+        # Jobs: int
+        _assert_input("n_jobs", n_jobs, "int", more_equal=1)
+        
+        # Engine: str
+        _assert_input("engine", engine, "str", accepted_values=["auto"]+engines.ENGINES)
+        if engine is not None and engine.lower()=="fft":
+            assert n_dimensions is None or n_dimensions<=3, "The 'fft' engine only supports 2 or 3 dimensions"
+        
+        # Negatives: int
+        _assert_input("n_negatives", n_negatives, "int", more_equal=1)
+        
+        # Cost pairs: int
+        _assert_input("cost_pairs", cost_pairs, "int", more_equal=1)
+        
+        # Memory limit: int|float
+        _assert_input("memory_limit", memory_limit, "number", more=0.)
+        
+        # Backend: str
+        _assert_input("backend", backend, "str", accepted_values=["auto", "numpy", "numba"])
+        
+        # Dtype: np.float32|np.float64
+        assert np.dtype(dtype) in [np.float32, np.float64], "dtype must be np.float32 or np.float64"
+        
+        # Metrics path: str
+        _assert_input("metrics_path", metrics_path, "str")
     def __input_validation(self, input, labels=None):
         assert _is_array_like(input), "The given input is not array-like"
-        result = np.array(input)
+        # Sin copia ni cambio de tipo: los arrays (y los memmap, que se conservan como tales) se leen por bloques
+        # y se convierten a self._dtype al calcular las distancias
+        result = input if isinstance(input, np.memmap) else np.asarray(input)
         
         if self._metric=="precomputed":
             assert result.ndim==2 and result.shape[0]==result.shape[1], "When metric is 'precomputed', input data must be a square distance matrix"
@@ -317,6 +571,11 @@ class TSne():
 
         if self._init is not None and _is_array_like(self._init) and len(input) != self._init.shape[0]:
             raise ValueError("The input data must have the same number of samples as the given embedding")
+        self.__labels_validation(labels, len(result))
+        if result.ndim>2:
+            return result.reshape((len(result), np.prod(result.shape[1:])))
+        return result
+    def __labels_validation(self, labels, n_samples):
         if labels is not None:
             assert _is_array_like(labels),"labels is not array-like"
             self._plotting_labels = np.array(labels, dtype=np.str_)
@@ -351,35 +610,35 @@ class TSne():
                         self._plotting_colors[indices] = colores[np.divmod(i, n)[0]]
                         self._plotting_markers[indices] = marker_options[int(i%len(marker_options))]
         else:
-            self._plotting_markers = np.full(shape=len(result), fill_value='o')
-            self._plotting_colors = np.full(shape=len(result), fill_value=1)
-        if result.ndim>2:
-            return result.reshape((len(result), np.prod(result.shape[1:])))
-        return result
-    def __rand_embed(self, input, n_dimensions) -> np.ndarray:
+            self._plotting_markers = np.full(shape=n_samples, fill_value='o')
+            self._plotting_colors = np.full(shape=n_samples, fill_value=1)
+    def __rand_embed(self, input, n_dimensions, affinities) -> np.ndarray:
         assert n_dimensions is not None
-        n_samples = len(input)
+        n_samples = similarities.n_samples_of(affinities)
         if self._init is None:
             return self._rng.standard_normal(size=(n_samples, n_dimensions))
         elif isinstance(self._init, str):
             if self._init.lower()=="pca":
-                from sklearn.decomposition import PCA
-                pca = PCA(n_components=n_dimensions, svd_solver="randomized", random_state=self._seed)
-                pca.set_output(transform="default")
-                data_embedded = pca.fit_transform(input).astype(np.float32, copy=False)
+                data_embedded = initialization.pca(input, n_dimensions, seed=self._seed)
+                return data_embedded / np.std(data_embedded[:, 0]) * 1e-4
+            elif self._init.lower()=="spectral":
+                data_embedded = initialization.spectral(affinities, n_dimensions, seed=self._seed)
                 return data_embedded / np.std(data_embedded[:, 0]) * 1e-4
             else: #init = "random"
                 return self._rng.standard_normal(size=(n_samples, n_dimensions))
         else:
             return self._init.copy()
     
-    def fit(self, input, labels=None, record_embed=False, record_cost=False, gif_filename=None, gif_kwargs=None) -> np.ndarray:
+    def fit(self, input, labels=None, record_embed=False, record_cost=False, gif_filename=None, gif_kwargs=None, callbacks=None, callback_every=1, animate=True) -> np.ndarray:
         """Fit the given data and display the embedding process
     
         Parameters
         ----------
         input: array-like of shape (n_samples, n_features).
-            The data to fit.
+            The data to fit. NumPy arrays and other buffers are not copied, and are converted
+            to dtype by blocks while computing the distances. If it is a np.memmap and the engine is not 'exact',
+            the neighbors are found by brute force over blocks of samples, so it can be bigger than the memory,
+            at a cost of O(n_samples^2*n_features) operations instead of that of the tree index.
         
         labels: None or array-like of shape (n_samples,).
             Array with the labels to assign each sample in the animation.
@@ -399,98 +658,756 @@ class TSne():
         
         gif_kwargs: dict
             Additional keyword arguments for the gif save method.
+        
+        callbacks : None or list of callables, default=None
+            Functions called every callback_every iterations of the descent as callback(i, embed, grad_norm, cost),
+            where embed is a read-only view of the current embedding, only valid during the call,
+            and cost is None in the iterations where it is not computed (see iters_check).
+            If any of them returns True, the descent stops after that iteration.
+            Not available when n_restarts>1.
+        
+        callback_every : int, default=1
+            Number of iterations between the calls to the callbacks.
+            Must be at least 1.
+        
+        animate : boolean, default=True
+            If False, the descent is run without displaying it and gif_filename is ignored.
+            When n_restarts>1, the embedding of every iteration is only requested from the
+            descents if their animation is drawn; otherwise only record_embed is honored, for the best one.
         """
 
         #====Tiempo de inicio para verbosidad====================================================================================================================
         t0 = time.time_ns()
+        self.__timer.reset()
 
         #====Input con dimensiones correctas=====================================================================================================================
+        with self.__timer.phase("validation"):
+            X = self.__input_validation(input, labels)
+            self._labels = None if labels is None else np.array(labels)
+        assert callbacks is None or self._n_restarts==1, "callbacks are not available when n_restarts>1"
+        self.__set_callbacks(callbacks, callback_every)
+        # Los callbacks se quitan aunque el descenso falle o se interrumpa
+        try:
+            p = self._affinities(X)
+            if self._n_restarts>1:
+                self.__fit_restarts(X, p, record_embed, record_cost, gif_filename, gif_kwargs, animate)
+            else:
+                with self.__tile_pool():
+                    self.__start(X, p, record_embed, record_cost)
+                    self.__save_affinities(p)
+                    if animate:
+                        self.__animate(p, 0, self._max_iter, "Initial embedding", gif_filename, gif_kwargs)
+                    else:
+                        self.__iterate(p, 0, self._max_iter)
+        finally:
+            self.__set_callbacks(None, 1)
+        
+        #====Salida por consola de verbosidad====================================================================================================================
+        if self._verbose>0:
+            self.__print_execution_time(t0)
+        
+        return self.embed
+    def _prepare(self, input, labels=None) -> tuple[np.ndarray, np.ndarray]:
+        """Validate the input and compute P and the initial embedding as fit does, without running the descent.
+        """
         X = self.__input_validation(input, labels)
+        p = self._affinities(X)
+        return p, self.__rand_embed(X, self._n_dimensions, p)
+    def _affinities(self, X) -> np.ndarray:
+        """Compute the joint probabilities P of the validated input, as used by fit.
+        """
+        #====Eleccion del motor, antes de reservar memoria=======================================================================================================
+        n_features = 0 if self._metric=="precomputed" else X.shape[1]
+        self.engine_used = self.__select_engine(len(X), n_features)
+        if self._verbose>0:
+            print("Using the {} engine".format(self.engine_used))
 
-        self._init_embed = self.__rand_embed(X, self._n_dimensions)
-        
+        #====Obtener P===========================================================================================================================================
+        if self.engine_used!="exact":
+            self.__knn_graph_init(X)
+            return self.__joint_p_knn()
+        # P es simetrica: se guarda condensada, cada par una vez
+        with self.__timer.phase("distances"):
+            if self._metric=="precomputed":
+                dist_original = distance.squareform(X.astype(self._dtype, copy=False), checks=False)
+            else:
+                dist_original = similarities.pairwise_euclidean_distance(X, condensed=True, dtype=self._dtype)
+        with self.__timer.phase("sigma_search"):
+            p, self._betas = similarities.joint_probabilities_gaussian(dist_original, self._perplexity, self._perplexity_tolerance, return_betas=True, backend=self._backend)
+        del dist_original
+        self._X = X
+        self._knn_forest = None
+        self._knn_neighbors = None
+        return p
+    def __select_engine(self, n_samples, n_features, *, sparse_p=False) -> str:
+        engine = self._engine
+        if sparse_p:
+            # P ya es dispersa: el motor exacto no tiene sentido
+            assert engine!="exact", "The 'exact' engine is not available with sparse affinities"
+        return engines.select_engine(n_samples, self._n_dimensions, engine, self._memory_limit, allow_exact=not sparse_p,
+                                     n_features=n_features, n_neighbors=min(3*int(self._perplexity), n_samples-1), n_negatives=self._n_negatives, itemsize=self._dtype.itemsize, n_threads=self._n_jobs)
+    def __start(self, X, p, record_embed, record_cost):
         #====Ajuste del learning rate============================================================================================================================
         if self._learning_rate == "auto":
-            self.__lr = len(X) / self._early_exaggeration
-            self.__lr = np.maximum(self.__lr, 50)
+            self.__lr = similarities.n_samples_of(p) / self._early_exaggeration
+            self.__lr = float(np.maximum(self.__lr, 50))
         else:
             self.__lr = self._learning_rate
 
-        #====Obtener P===========================================================================================================================================
-        if self._metric=="precomputed":
-            p = similarities.joint_probabilities_gaussian(X, self._perplexity, self._perplexity_tolerance)
-        else:
-            dist_original = similarities.pairwise_euclidean_distance(X)
-            p = similarities.joint_probabilities_gaussian(dist_original, self._perplexity, self._perplexity_tolerance)
-            del dist_original
+        self._init_embed = self.__rand_embed(X, self._n_dimensions, p).astype(self._dtype, copy=False)
         
         #===Coste inicial
-        dist_embed = similarities.pairwise_euclidean_distance(self._init_embed)
-        q = similarities.joint_probabilities_student(dist_embed)
-        c = kl_divergence(p, q)
+        self.embed = self._init_embed
+        c = self._cost(p)
         self.cost = c
         self._best_cost = c
         self._best_iter = 0
-        del q, dist_embed
+        self._stop_iter = None
+        self._moving = None
+        self.n_iter = self._max_iter
 
         #====Descenso de gradiente===============================================================================================================================
         
         self._update = np.zeros_like(self._init_embed)
+        self._gains = np.ones_like(self._init_embed) if self._adaptive_gains else None
         self.embed = self._init_embed.copy()
 
-        if record_embed:
-            self.embedding_record = [self.embed.copy()]
-        if record_cost:
-            self.cost_record = {0: self.cost}
+        self.embedding_record = [self.embed.copy()] if record_embed else None
+        self.__start_history(record_cost)
+        self.history.append(0, cost=self.cost, spread=_spread(self.embed))
+    def _descend(self, p, record_embed=False, record_cost=False) -> np.ndarray:
+        """Run the whole descent on the given joint probabilities P, without displaying it.
+
+        Used to run several descents on the same P in worker processes, where nothing is displayed.
+        init must not be 'pca', since the input data is not available.
+        """
+        assert not (isinstance(self._init, str) and self._init.lower()=="pca"), "init cannot be 'pca' without the input data"
+        if sparse.issparse(p):
+            self.engine_used = self.__select_engine(p.shape[0], 0, sparse_p=True)
+        else:
+            assert self._engine in ["auto", "exact"], "The '{}' engine needs sparse affinities".format(self._engine)
+            self.engine_used = "exact"
+        with self.__tile_pool():
+            self.__start(None, p, record_embed, record_cost)
+            self.__iterate(p, 0, self._max_iter)
+        return self.embed
+    def __iterate(self, affinities, start_iter, stop_iter):
+        # Las iteraciones de __animate, sin dibujarlas
+        for i in self.__frames(start_iter, stop_iter):
+            self.__update_embed(i, affinities)
+        self.history.flush()
+        if self._stop_iter is not None:
+            self.n_iter = self._stop_iter+1
+    def __fit_restarts(self, X, p, record_embed, record_cost, gif_filename, gif_kwargs, animate):
+        from . import sweep
+        params = self._get_params()
+        params.update(n_restarts=1, n_jobs=1, checkpoint_path=None, metrics_path=None, engine=self.engine_used)
+        if isinstance(self._init, str) and self._init.lower()=="pca":
+            params["init"] = self.__rand_embed(X, self._n_dimensions, p)
+        param_list = [{**params, "seed": self._seed+r} for r in range(self._n_restarts)]
+        # Los embeddings de cada iteracion solo se piden a todas las ejecuciones si se dibuja la cuadricula
+        results = sweep._run_shared(p, param_list, n_jobs=self._n_jobs, record_embed=animate or record_embed)
         
+        #====Se conserva la ejecucion con menor coste final======================================================================================================
+        self.restart_costs = np.array([r["cost"] for r in results])
+        best = results[int(np.argmin(self.restart_costs))]
+        self.embed = best["embed"]
+        self._init_embed = best["init_embed"]
+        self._update = best["update"]
+        self._gains = best["gains"]
+        self.cost = best["cost"]
+        self._best_cost = best["best_cost"]
+        self._best_iter = best["best_iter"]
+        self._stop_iter = None
+        self.n_iter = best["n_iter"]
+        self.__start_history(record_cost)
+        self.history.extend(best["history"])
+        self.history.flush()
+        self.embedding_record = best["embedding_record"] if record_embed else None
+
+        if animate:
+            titles = ["seed={}, cost={:.3f}{}".format(params["seed"], r["cost"], " (best)" if r is best else "") for params, r in zip(param_list, results)]
+            sweep.animate_grid([r["embedding_record"] for r in results], titles, colors=self._plotting_colors, size=self._plotting_size, gif_filename=gif_filename, gif_kwargs=gif_kwargs)
+    def _get_params(self) -> dict:
+        """Returns the parameters of the model, as keyword arguments of TSne.
+        """
+        return {
+            "n_dimensions": self._n_dimensions,
+            "init": self._init,
+            "perplexity": self._perplexity,
+            "perplexity_tolerance": self._perplexity_tolerance,
+            "metric": self._metric,
+            "early_exaggeration": self._early_exaggeration,
+            "learning_rate": self._learning_rate,
+            "starting_momentum": self._momentum_start,
+            "ending_momentum": self._momentum_end,
+            "momentum_threshold": self._momentum_threshold,
+            "adaptive_gains": self._adaptive_gains,
+            "min_gain": self._min_gain,
+            "n_iter": self._max_iter,
+            "iters_check": self._iters_check,
+            "min_grad_norm": self._min_grad_norm,
+            "n_iter_without_progress": self._n_iter_without_progress,
+            "seed": self._seed,
+            "checkpoint_path": self._checkpoint_path,
+            "checkpoint_every": self._checkpoint_every,
+            "n_restarts": self._n_restarts,
+            "n_jobs": self._n_jobs,
+            "engine": self._engine,
+            "n_negatives": self._n_negatives,
+            "cost_pairs": self._cost_pairs,
+            "memory_limit": self._memory_limit,
+            "backend": self._backend,
+            "dtype": self._dtype,
+            "metrics_path": self._metrics_path,
+            "verbose": self._verbose,
+        }
+    def __init_plotting(self):
+        if self._plotting_fig is None:
+            self._plotting_fig, self._plotting_ax = plt.subplots() if self._n_dimensions==2 else plt.subplots(subplot_kw=dict({"projection": "3d"}))
+
+    def __animate(self, affinities, start_iter, stop_iter, title, gif_filename, gif_kwargs):
+        self.__init_plotting()
         if self._n_dimensions==2:
-            line = self._plotting_ax.scatter(self._init_embed.T[0], self._init_embed.T[1], label=self._plotting_labels, c=self._plotting_colors, s=self._plotting_size)
+            line = self._plotting_ax.scatter(self.embed.T[0], self.embed.T[1], label=self._plotting_labels, c=self._plotting_colors, s=self._plotting_size)
         else:
-            line = self._plotting_ax.scatter(self._init_embed.T[0], self._init_embed.T[1], self._init_embed.T[2], label=self._plotting_labels, c=self._plotting_colors, s=self._plotting_size)
+            line = self._plotting_ax.scatter(self.embed.T[0], self.embed.T[1], self.embed.T[2], label=self._plotting_labels, c=self._plotting_colors, s=self._plotting_size)
         
         if self._plotting_labels is not None:
             leg = self._plotting_ax.legend(*line.legend_elements(), loc="lower right")
             self._plotting_ax.add_artist(leg)
-        plt.title("Initial embedding")
-        ani = animation.FuncAnimation(self._plotting_fig, self.__update_anim, self.n_iter, fargs=[p, self._plotting_ax], interval=100, repeat=False)
-
+        plt.title(title)
+        ani = animation.FuncAnimation(self._plotting_fig, self.__update_anim, partial(self.__frames, start_iter, stop_iter), init_func=self.__init_anim, fargs=[affinities, self._plotting_ax], save_count=stop_iter-start_iter, cache_frame_data=False, interval=100, repeat=False)
+        self.__show_animation(ani, gif_filename, gif_kwargs)
+        
+        if self._stop_iter is not None:
+            self.n_iter = self._stop_iter+1
+    def __start_history(self, record_cost, records=None):
+        self.history = history.History(records, path=self._metrics_path)
+        self.cost_record = self.history.costs() if record_cost else None
+        self._last_record_time = time.perf_counter()
+    def __set_callbacks(self, callbacks, callback_every):
+        _assert_input("callback_every", callback_every, "int", more_equal=1)
+        assert callbacks is None or all(callable(c) for c in callbacks), "callbacks must be a list of callables"
+        self._callbacks = [] if callbacks is None else list(callbacks)
+        self._callback_every = callback_every
+    def __show_animation(self, ani, gif_filename, gif_kwargs):
         if gif_filename is None:
             plt.show()
         else:
-            ani.save(gif_filename, **gif_kwargs)
+            # Las iteraciones se ejecutan dentro de save: el resto del tiempo es dibujar y escribir los frames
+            start = time.perf_counter()
+            timed = self.__timer.total()
+            ani.save(gif_filename, **({} if gif_kwargs is None else gif_kwargs))
+            self.__timer.add("encoding", time.perf_counter()-start-(self.__timer.total()-timed))
+        self.history.flush()
+    def __print_execution_time(self, t0):
+        t = (time.time_ns()-t0)*1e-9
+        tiempos = np.array([t, t/max(self.n_iter, 1)])
+        tiempos_exacto = np.floor(tiempos)
+        tH = (tiempos_exacto//3600).astype(int)
+        tM = (tiempos_exacto//60).astype(int)-60*tH
+        tS = tiempos - np.array(tH*3600+tM*60, dtype=float)
         
+        strings = []
+        for i in range(len(tiempos)):
+            if tiempos[i]>3600:
+                strings.append("(h:min:sec): {}:{}:{}".format(tH[i],tM[i],tS[i]))
+            elif tiempos[i]>60:
+                strings.append("(min:sec): {}:{}".format(tM[i],tS[i]))
+            else:
+                strings.append("(s): {}".format(tS[i]))
+        
+        print("====================================")
+        print("Embedding process finished")
+        print("Execution time " + strings[0])
+        print("Time/Iteration " + strings[1])
+        for name, phase in self.timings_.items():
+            print("  {}: {:.3f} s, {} calls".format(name, phase["seconds"], phase["calls"]))
+        print("====================================")
+
+    def resume(self, path, labels=None, record_embed=False, record_cost=False, gif_filename=None, gif_kwargs=None, callbacks=None, callback_every=1) -> np.ndarray:
+        """Continue the embedding process from a checkpoint and display it
+
+        The descent continues exactly as it would have if it had not been interrupted,
+        up to n_iter iterations, using the affinities P referenced by the checkpoint.
+        If the checkpoint is of a finished descent, its state is restored and nothing is displayed.
+    
+        Parameters
+        ----------
+        path: str.
+            The checkpoint file, written during fit when checkpoint_path is given.
+        
+        labels: None or array-like of shape (n_samples,).
+            Array with the labels to assign each sample in the animation.
+            If None, all samples will be asumed to have the same label.
+        
+        record_embed : boolean, default=False.
+            If True, a record of each iteration of embedding from the checkpoint onwards is kept in a list.
+            This list is stored in the parameter embedding_record.
+        
+        record_cost : boolean, default=False.
+            If True, a record of the value of the cost function is kept in a dictionary,
+            including the values recorded before the checkpoint, if any.
+            This dictionary is stored in the parameter cost_record.
+        
+        gif_filename: str or None. default=None. Optional.
+            The file to output the animation to.
+            If None, the animation is displayed once
+        
+        gif_kwargs: dict
+            Additional keyword arguments for the gif save method.
+        
+        callbacks : None or list of callables, default=None
+            Functions called every callback_every iterations of the descent as callback(i, embed, grad_norm, cost),
+            where embed is a read-only view of the current embedding, only valid during the call,
+            and cost is None in the iterations where it is not computed (see iters_check).
+            If any of them returns True, the descent stops after that iteration.
+        
+        callback_every : int, default=1
+            Number of iterations between the calls to the callbacks.
+            Must be at least 1.
+        """
+        t0 = time.time_ns()
+        self.__timer.reset()
+
+        with np.load(path) as state:
+            iteration = int(state["iteration"])
+            embed = state["embed"]
+            assert embed.shape[1]==self._n_dimensions, "The checkpoint must have the number of dimensions of the model"
+            self.embed = embed.copy()
+            self._init_embed = embed.copy()
+            self._update = state["update"].copy()
+            self._gains = state["gains"].copy() if state["gains"].size>0 else None
+            self.cost = float(state["cost"])
+            self._best_cost = float(state["best_cost"])
+            self._best_iter = int(state["best_iter"])
+            self._stop_iter = None if int(state["stop_iter"])<0 else int(state["stop_iter"])
+            self._moving = None
+            self.__lr = float(state["learning_rate"])
+            self._rng.bit_generator.state = json.loads(str(state["rng_state"]))
+            self._affinities_path = str(state["affinities_path"])
+            if "history" in state:
+                records = state["history"]
+            else:
+                # Checkpoints anteriores: solo el registro del coste
+                legacy = history.History()
+                for i, c in (state["cost_record"] if "cost_record" in state else []):
+                    legacy.append(int(i), cost=c)
+                records = legacy.records
+            engine = str(state["engine"]) if "engine" in state else None
+        p = sparse.load_npz(self._affinities_path) if self._affinities_path.endswith(".npz") else np.load(self._affinities_path)
+        assert similarities.n_samples_of(p)==len(self.embed), "The cached affinities do not match the embedding of the checkpoint"
+        if engine is None:
+            engine = "sparse" if sparse.issparse(p) else "exact"
+        self.engine_used = engine
+        
+        self.__labels_validation(labels, len(self.embed))
+        self.n_iter = self._max_iter
+        self.embedding_record = [self.embed.copy()] if record_embed else None
+        self.__start_history(record_cost, records)
+        
+        if iteration+1>=self._max_iter or self._stop_iter is not None:
+            # Descenso ya terminado: se restaura el estado, sin iteraciones que animar
+            if self._stop_iter is not None:
+                self.n_iter = self._stop_iter+1
+            self.history.flush()
+        else:
+            self.__set_callbacks(callbacks, callback_every)
+            try:
+                with self.__tile_pool():
+                    self.__animate(p, iteration+1, self._max_iter, "Resumed from iteration {}".format(iteration+1), gif_filename, gif_kwargs)
+            finally:
+                self.__set_callbacks(None, 1)
         
-        #====Salida por consola de verbosidad====================================================================================================================
         if self._verbose>0:
-            t = (time.time_ns()-t0)*1e-9
-            tiempos = np.array([t, t/self.n_iter])
-            tiempos_exacto = np.floor(tiempos)
-            tH = np.floor(tiempos_exacto/3600, dtype=int)
-            tM = np.floor(tiempos_exacto/60, dtype=int)-60*tH
-            tS = tiempos - np.array(tH*3600+tM*60, dtype=float)
+            self.__print_execution_time(t0)
+        
+        return self.embed
+
+    def partial_fit(self, input, labels=None, n_iter=None, record_embed=False, record_cost=False, gif_filename=None, gif_kwargs=None) -> np.ndarray:
+        """Add a batch of samples to the embedding and display how it adapts
+
+        The affinities P are sparse, computed from the 3*perplexity nearest neighbors of each sample.
+        When a batch arrives, only the neighbors of the new samples, and of the samples that
+        get one of them as a new neighbor, are searched and their affinities recomputed.
+        The new samples start at the mean of the embedding of their neighbors,
+        and the descent continues from the current embedding.
+        
+        The first batch, or the first one after fit, is embedded like in fit, with the early exaggeration phase.
+        The following ones only run the second phase of the descent, and only move the new samples and the
+        samples that got one of them as a new neighbor, whose affinities were recomputed.
+        The other samples stay fixed, like in transform, so each iteration costs O(n_moving*n_samples)
+        instead of O(n_samples^2), and the normalization of the fixed pairs is estimated once per batch
+        from random pairs. If more than half of the samples would move, the whole embedding is descended.
+    
+        Parameters
+        ----------
+        input: array-like of shape (n_batch_samples, n_features).
+            The batch of samples to add.
+        
+        labels: None or array-like of shape (n_batch_samples,).
+            Array with the labels to assign each sample of the batch in the animation.
+            If None, all samples will be asumed to have the same label.
+            It must be given for every batch or for none of them.
+        
+        n_iter : int or None, default=None.
+            Number of iterations to run for this batch.
+            If None, n_iter for the first batch. For the following ones, n_iter-momentum_threshold
+            scaled by the size of the batch relative to the samples already embedded, with a minimum of 50.
+        
+        record_embed : boolean, default=False.
+            If True, a record of each iteration of embedding for this batch is kept in a list.
+            This list is stored in the parameter embedding_record.
+        
+        record_cost : boolean, default=False.
+            If True, a record of the value of the cost function for this batch is kept in a dictionary.
+            This dictionary is stored in the parameter cost_record.
+        
+        gif_filename: str or None. default=None. Optional.
+            The file to output the animation to.
+            If None, the animation is displayed once
+        
+        gif_kwargs: dict
+            Additional keyword arguments for the gif save method.
+        """
+        t0 = time.time_ns()
+        self.__timer.reset()
+        assert self._metric!="precomputed", "partial_fit is not available when metric is 'precomputed'"
+        _assert_input("n_iter", n_iter, "int", more_equal=1)
+        with self.__timer.phase("validation"):
+            assert _is_array_like(input), "The given input is not array-like"
+            X_batch = np.array(input)
+            if X_batch.ndim>2:
+                X_batch = X_batch.reshape((len(X_batch), np.prod(X_batch.shape[1:])))
+            if labels is not None:
+                assert _is_array_like(labels) and len(labels)==len(X_batch), "labels must be array-like with one label per sample of the batch"
+        
+        if self.embed is not None and self._knn_neighbors is None:
+            # Modelo ajustado con fit: se construye el grafo de vecinos una sola vez
+            self.__knn_graph_init(self._X)
+        n_total = len(X_batch) if self.embed is None else len(self._X)+len(X_batch)
+        self.engine_used = self.__select_engine(n_total, X_batch.shape[1], sparse_p=True)
+        
+        if self.embed is None:
+            assert len(X_batch)>=2*int(self._perplexity), "The number of samples cannot be lower than twice the given Perplexity"
+            self._labels = None if labels is None else np.array(labels)
+            self.__knn_graph_init(X_batch)
+            p = self.__joint_p_knn()
             
-            strings = []
-            for i in range(len(tiempos)):
-                if tiempos[i]>3600:
-                    strings.append("(h:min:sec): {}:{}:{}".format(tH[i],tM[i],tS[i]))
-                elif tiempos[i]>60:
-                    strings.append("(min:sec): {}:{}".format(tM[i],tS[i]))
-                else:
-                    strings.append("(s): {}".format(tS[i]))
+            self._init_embed = self.__rand_embed(X_batch, self._n_dimensions, p).astype(self._dtype, copy=False)
+            self.embed = self._init_embed.copy()
+            self._update = np.zeros_like(self.embed)
+            self._gains = np.ones_like(self.embed) if self._adaptive_gains else None
+            start_iter = 0
+            stop_iter = self._max_iter if n_iter is None else n_iter
+            self._moving = None
+        else:
+            assert X_batch.ndim==2 and X_batch.shape[1]==self._X.shape[1], "The batch must have the same number of features as the previous data"
+            assert (labels is None)==(self._labels is None), "labels must be given for every batch or for none of them"
+            if labels is not None:
+                self._labels = np.concatenate([self._labels, labels])
+            n_old = len(self._X)
+            rows = self.__knn_graph_extend(X_batch)
+            p = self.__joint_p_knn()
+
+            # Las nuevas muestras empiezan en la media de sus vecinos ya embebidos
+            cond_p = self._knn_cond_p[n_old:] * (self._knn_neighbors[n_old:]<n_old)
+            weights = cond_p.sum(axis=1)
+            neighbors_old = np.where(self._knn_neighbors[n_old:]<n_old, self._knn_neighbors[n_old:], 0)
+            embed_new = np.einsum("ik,ikd->id", cond_p, self.embed[neighbors_old])/np.maximum(weights, np.finfo(float).tiny)[:, None]
+            if np.any(weights==0):
+                _, nearest = similarities.knn_forest_query(self._knn_forest, X_batch[weights==0], 1, query_indices=n_old+np.flatnonzero(weights==0))
+                embed_new[weights==0] = self.embed[nearest[:, 0]]
+            embed_new += 1e-4*np.std(self.embed)*self._rng.standard_normal(size=embed_new.shape)
+            embed_new = embed_new.astype(self._dtype, copy=False)
+            
+            self.embed = np.vstack([self.embed, embed_new])
+            self._init_embed = self.embed.copy()
+            self._update = np.vstack([self._update, np.zeros_like(embed_new)])
+            if self._gains is not None:
+                self._gains = np.vstack([self._gains, np.ones_like(embed_new)])
             
-            print("====================================")
-            print("Embedding process finished")
-            print("Execution time " + strings[0])
-            print("Time/Iteration " + strings[1])
-            print("====================================")
-            del t0,t,tiempos,tiempos_exacto,tS,tM,tH,strings
+            # Solo se mueven las nuevas muestras y las que las tienen como vecinas, cuyas afinidades se han recalculado.
+            # El resto queda fijo, como en transform, y el coste de cada iteracion crece con el tamaño del lote
+            self._moving = rows if 2*len(rows)<=n_total else None
+            start_iter = max(self.n_iter, self._momentum_threshold)
+            if n_iter is None:
+                n_iter = self._max_iter-self._momentum_threshold
+                n_iter = min(n_iter, max(50, int(np.ceil(n_iter*len(X_batch)/n_old))))
+            stop_iter = start_iter + n_iter
+        self.__labels_validation(self._labels, len(self._X))
+        
+        if self._learning_rate == "auto":
+            self.__lr = float(np.maximum(len(self._X) / self._early_exaggeration, 50))
+        else:
+            self.__lr = self._learning_rate
+        
+        #===Coste inicial
+        if self._moving is None:
+            self.cost = self._cost(self._early_exaggeration*p if start_iter<self._momentum_threshold else p)
+        else:
+            # La normalizacion de los pares de muestras fijas se estima una vez, por muestreo
+            with self.__timer.phase("cost"):
+                z = engines.normalization_sampled(self.embed, n_pairs=100000 if self._cost_pairs is None else self._cost_pairs, rng=self._rng)
+                self._z_fixed = z - engines.gradient_rows(p, self.embed, self._moving, 0.)[1]
+                self.cost = engines.kl_divergence_sparse(p, self.embed, z)
+        self._best_cost = self.cost
+        self._best_iter = start_iter
+        self._stop_iter = None
+        self.n_iter = stop_iter
+        
+        self.embedding_record = [self.embed.copy()] if record_embed else None
+        self.__start_history(record_cost)
+        self.history.append(start_iter, cost=self.cost, spread=_spread(self.embed))
+        
+        self.__save_affinities(p)
+        title = "Initial embedding" if start_iter==0 else "{} new samples".format(len(X_batch))
+        self.__animate(p, start_iter, stop_iter, title, gif_filename, gif_kwargs)
+        
+        if self._verbose>0:
+            self.__print_execution_time(t0)
         
         return self.embed
+    def fit_sequence(self, inputs, labels=None, n_iter_snapshot=None, temporal_weight=0., record_embed=False, record_cost=False, gif_filename=None, gif_kwargs=None) -> np.ndarray:
+        """Fit a sequence of snapshots of the same samples and display how the embedding evolves
 
-    def __update_embed(self, i, affinities):
-        embed_dist = similarities.pairwise_euclidean_distance(self.embed)
-        q = similarities.joint_probabilities_student(embed_dist)
+        The first snapshot is embedded like in partial_fit, and each of the following ones
+        continues the descent from the final embedding of the previous one, in the same animation.
+        The affinities P are sparse, computed from the 3*perplexity nearest neighbors of each sample,
+        and the neighbors of a sample are only searched again if it, one of its neighbors,
+        or a sample that changed and is now closer than them, changed between snapshots.
+    
+        Parameters
+        ----------
+        inputs: sequence of array-like of shape (n_samples, n_features).
+            The snapshots to fit. Row i of every snapshot must belong to the same sample.
+        
+        labels: None or array-like of shape (n_samples,).
+            Array with the labels to assign each sample in the animation.
+            If None, all samples will be asumed to have the same label.
+        
+        n_iter_snapshot : int or None, default=None.
+            Number of iterations to run for each snapshot after the first one.
+            If None, n_iter-momentum_threshold. The first snapshot runs n_iter iterations.
+        
+        temporal_weight : float, default=0.
+            Weight of a penalty on the squared distance of each sample to its position
+            at the end of the previous snapshot, which keeps the embedding coherent in time.
+            If 0, no penalty is applied.
+        
+        record_embed : boolean, default=False.
+            If True, a record of each iteration of embedding is kept in a list.
+            This list is stored in the parameter embedding_record.
+        
+        record_cost : boolean, default=False.
+            If True, a record of the value of the cost function throughout the embedding process is kept in a dictionary.
+            This dictionary is stored in the parameter cost_record.
+        
+        gif_filename: str or None. default=None. Optional.
+            The file to output the animation to.
+            If None, the animation is displayed once
+        
+        gif_kwargs: dict
+            Additional keyword arguments for the gif save method.
+
+        Returns
+        -------
+        embeddings : ndarray of shape (n_snapshots, n_samples, n_dimensions)
+            The final embedding of each snapshot.
+        """
+        t0 = time.time_ns()
+        self.__timer.reset()
+        assert self._metric!="precomputed", "fit_sequence is not available when metric is 'precomputed'"
+        assert isinstance(inputs, Sequence) and len(inputs)>0, "inputs must be a non empty sequence of snapshots"
+        _assert_input("n_iter_snapshot", n_iter_snapshot, "int", more_equal=1)
+        _assert_input("temporal_weight", temporal_weight, "number", more_equal=0.)
+        with self.__timer.phase("validation"):
+            snapshots = [self.__input_validation(x, labels) for x in inputs]
+        assert all(x.shape==snapshots[0].shape for x in snapshots), "All the snapshots must have the same shape"
+        self._labels = None if labels is None else np.array(labels)
+        self.engine_used = self.__select_engine(len(snapshots[0]), snapshots[0].shape[1], sparse_p=True)
+        
+        self.__knn_graph_init(snapshots[0])
+        p = self.__joint_p_knn()
+        self._init_embed = self.__rand_embed(snapshots[0], self._n_dimensions, p).astype(self._dtype, copy=False)
+        self.embed = self._init_embed.copy()
+        self._update = np.zeros_like(self.embed)
+        self._gains = np.ones_like(self.embed) if self._adaptive_gains else None
+        self._temporal_weight = temporal_weight
+        self._temporal_anchor = None
+        self._moving = None
+        if self._learning_rate == "auto":
+            self.__lr = float(np.maximum(len(self._X) / self._early_exaggeration, 50))
+        else:
+            self.__lr = self._learning_rate
+        
+        self.cost = self._cost(self._early_exaggeration*p)
+        self._best_cost = self.cost
+        self._best_iter = 0
+        self._stop_iter = None
+        n_iter_snapshot = self._max_iter-self._momentum_threshold if n_iter_snapshot is None else n_iter_snapshot
+        self.n_iter = self._max_iter + (len(snapshots)-1)*n_iter_snapshot
+        self.embedding_record = [self.embed.copy()] if record_embed else None
+        self.__start_history(record_cost)
+        self.history.append(0, cost=self.cost, spread=_spread(self.embed))
+        self.__save_affinities(p)
+        
+        #====Animacion continua de todos los snapshots===========================================================================================================
+        state = {"snapshot": 0, "p": p, "finals": []}
+        self.__init_plotting()
+        if self._n_dimensions==2:
+            self._plotting_ax.scatter(self.embed.T[0], self.embed.T[1], c=self._plotting_colors, s=self._plotting_size)
+        else:
+            self._plotting_ax.scatter(self.embed.T[0], self.embed.T[1], self.embed.T[2], c=self._plotting_colors, s=self._plotting_size)
+        plt.title("Initial embedding")
+        ani = animation.FuncAnimation(self._plotting_fig, self.__update_sequence_anim, partial(self.__sequence_frames, len(snapshots), n_iter_snapshot), init_func=self.__init_anim,
+                                      fargs=[snapshots, state, self._plotting_ax], save_count=self.n_iter, cache_frame_data=False, interval=100, repeat=False)
+        self.__show_animation(ani, gif_filename, gif_kwargs)
+        state["finals"].append(self.embed.copy())
+        self.n_iter = state["last_iter"]+1 if "last_iter" in state else 0
+        self._temporal_anchor = None
+        
+        if self._verbose>0:
+            self.__print_execution_time(t0)
+        
+        return np.array(state["finals"])
+    def __sequence_frames(self, n_snapshots, n_iter_snapshot):
+        next_iter = 0
+        for t in range(n_snapshots):
+            start_iter = 0 if t==0 else max(next_iter, self._momentum_threshold)
+            stop_iter = start_iter + (self._max_iter if t==0 else n_iter_snapshot)
+            self._stop_iter = None
+            for i in range(start_iter, stop_iter):
+                if self._stop_iter is not None:
+                    break
+                yield t, i
+                next_iter = i+1
+    def __update_sequence_anim(self, frame, snapshots, state, ax:Axes):
+        t, i = frame
+        if t!=state["snapshot"]:
+            # Nuevo snapshot: se parte del embedding final del anterior
+            state["finals"].append(self.embed.copy())
+            state["snapshot"] = t
+            n_reused = self.__knn_graph_update(snapshots[t])
+            state["p"] = self.__joint_p_knn()
+            self._temporal_anchor = self.embed.copy()
+            # Coste de partida del snapshot: la primera iteracion puede no ser multiplo de iters_check
+            self._best_cost = self.cost = self._cost(state["p"])
+            self._best_iter = i
+            self.__save_affinities(state["p"])
+            if self._verbose>1:
+                print("Snapshot {}: reused the neighbors of {}/{} samples".format(t+1, n_reused, len(self._X)))
+        self.__update_embed(i, state["p"])
+        state["last_iter"] = i
+        with self.__timer.phase("rendering"):
+            self.__draw_embed(ax, "Snapshot {}/{}, iteration {} \n Best cost: i={}, cost={:.3f}".format(t+1, len(snapshots), i+1, self._best_iter, self._best_cost))
+    def __knn_graph_update(self, X) -> int:
+        changed = np.flatnonzero(np.any(X!=self._X, axis=1))
+        if changed.size==0:
+            return len(X)
+        with self.__timer.phase("distances"):
+            self._X = X
+            self._knn_forest = similarities.knn_forest_add([], X, 0)
+            
+            # Muestras afectadas: las que cambian, las que tenian un vecino que cambia,
+            # y aquellas a las que una muestra que cambia se acerca mas que su vecino mas lejano
+            affected = np.zeros(len(X), dtype=bool)
+            affected[changed] = True
+            affected |= np.isin(self._knn_neighbors, changed).any(axis=1)
+            changed_forest = similarities.knn_forest_add([], X[changed], 0)
+            closest_changed, _ = similarities.knn_forest_query(changed_forest, X, 1)
+            affected |= closest_changed[:, 0]<self._knn_dists.max(axis=1)
+            
+            rows = np.flatnonzero(affected)
+            k = self._knn_neighbors.shape[1]
+            self._knn_dists[rows], self._knn_neighbors[rows] = similarities.knn_forest_query(self._knn_forest, X[rows], k, query_indices=rows)
+        with self.__timer.phase("sigma_search"):
+            self._knn_cond_p[rows], self._betas[rows] = similarities.conditional_probabilities_knn(self._knn_dists[rows], self._perplexity, self._perplexity_tolerance, betas=self._betas[rows], backend=self._backend)
+        return len(X)-len(rows)
+    def __knn_graph_init(self, X):
+        self._X = X
+        k = min(3*int(self._perplexity), len(X)-1)
+        with self.__timer.phase("distances"):
+            if self._metric=="precomputed":
+                self._knn_forest = None
+                self._knn_dists, self._knn_neighbors = similarities.knn_precomputed(X, k)
+            elif isinstance(X, np.memmap):
+                # Datos en disco: el kd-tree copiaria todas las muestras a memoria. Se construye solo si se necesita despues
+                self._knn_forest = None
+                self._knn_dists, self._knn_neighbors = similarities.knn_blocked(X, k, dtype=self._dtype)
+            else:
+                self._knn_forest = similarities.knn_forest_add([], X, 0)
+                self._knn_dists, self._knn_neighbors = similarities.knn_forest_query(self._knn_forest, X, k, query_indices=np.arange(len(X)))
+        with self.__timer.phase("sigma_search"):
+            self._knn_cond_p, self._betas = similarities.conditional_probabilities_knn(self._knn_dists, self._perplexity, self._perplexity_tolerance, backend=self._backend)
+    def __knn_graph_extend(self, X_batch):
+        n_old = len(self._X)
+        new_indices = np.arange(n_old, n_old+len(X_batch))
+        k = self._knn_neighbors.shape[1]
+        with self.__timer.phase("distances"):
+            if self._knn_forest is None:
+                self._knn_forest = similarities.knn_forest_add([], self._X, 0)
+            self._X = np.vstack([self._X, X_batch])
+            self._knn_forest = similarities.knn_forest_add(self._knn_forest, self._X, n_old)
+            new_dists, new_neighbors = similarities.knn_forest_query(self._knn_forest, X_batch, k, query_indices=new_indices)
+            
+            # Las muestras antiguas que pasan a tener una nueva como vecina se buscan entre los vecinos de las nuevas
+            old = new_neighbors<n_old
+            rows = new_neighbors[old]
+            cols = np.broadcast_to(new_indices[:, None], new_neighbors.shape)[old]
+            changed = similarities.knn_insert(self._knn_neighbors, self._knn_dists, rows, cols, new_dists[old])
+        
+        self._knn_neighbors = np.vstack([self._knn_neighbors, new_neighbors])
+        self._knn_dists = np.vstack([self._knn_dists, new_dists])
+        self._knn_cond_p = np.vstack([self._knn_cond_p, np.zeros_like(new_dists)])
+        self._betas = np.concatenate([self._betas, np.full(len(X_batch), np.nan)])
+        
+        # Solo se recalculan las filas afectadas, partiendo de la beta que ya tenian
+        rows = np.concatenate([changed, new_indices])
+        betas = self._betas[rows]
+        betas[np.isnan(betas)] = 1/np.maximum(np.median(self._knn_dists[rows[np.isnan(betas)]], axis=1), np.finfo(float).tiny)
+        with self.__timer.phase("sigma_search"):
+            self._knn_cond_p[rows], self._betas[rows] = similarities.conditional_probabilities_knn(self._knn_dists[rows], self._perplexity, self._perplexity_tolerance, betas=betas, backend=self._backend)
+        return rows
+    def __joint_p_knn(self) -> sparse.csr_matrix:
+        with self.__timer.phase("symmetrization"):
+            return similarities.joint_probabilities_knn(self._knn_cond_p, self._knn_neighbors).astype(self._dtype)
+    def __save_affinities(self, p):
+        if self._checkpoint_path is None:
+            return
+        if sparse.issparse(p):
+            self._affinities_path = os.path.splitext(self._checkpoint_path)[0]+"_p.npz"
+            self.__save_atomic(self._affinities_path, partial(sparse.save_npz, matrix=p))
+        else:
+            self._affinities_path = os.path.splitext(self._checkpoint_path)[0]+"_p.npy"
+            self.__save_atomic(self._affinities_path, partial(np.save, arr=p))
+    def __save_checkpoint(self, i):
+        state = {
+            "iteration": i,
+            "embed": self.embed,
+            "update": self._update,
+            "gains": np.empty(0) if self._gains is None else self._gains,
+            "cost": self.cost,
+            "best_cost": self._best_cost,
+            "best_iter": self._best_iter,
+            "stop_iter": -1 if self._stop_iter is None else self._stop_iter,
+            "learning_rate": self.__lr,
+            "rng_state": json.dumps(self._rng.bit_generator.state),
+            "affinities_path": os.path.abspath(self._affinities_path),
+            "engine": self.engine_used,
+            "history": self.history.records,
+        }
+        self.__save_atomic(self._checkpoint_path, partial(np.savez, **state))
+    @staticmethod
+    def __save_atomic(path, save):
+        # Escribir en un temporal y renombrar: un checkpoint nunca queda a medias si el proceso muere
+        tmp_path = path+".tmp"
+        with open(tmp_path, "wb") as f:
+            save(f)
+        os.replace(tmp_path, path)
 
+    def __update_embed(self, i, affinities):
         # Momentum switch
         if i<self._momentum_threshold:
             p = self._early_exaggeration*affinities
@@ -499,26 +1416,121 @@ class TSne():
             p = affinities
             momentum = self._momentum_end
         
+        with self.__timer.phase("gradient"):
+            if self._moving is None:
+                grad, z = self.__gradient(p)
+            else:
+                grad, z = engines.gradient_rows(p, self.embed, self._moving, self._z_fixed)
+        # Filas que se actualizan: todas, o solo las moviles de partial_fit
+        rows = slice(None) if self._moving is None else self._moving
+        
         # Cost
-        if i%self._iters_check==0:
-            self.cost = kl_divergence(p, q)
+        checked = i%self._iters_check==0
+        if checked:
+            with self.__timer.phase("cost"):
+                self.cost = self.__kl_divergence(p, z)
             if self._best_cost is None or self.cost<self._best_cost:
                 self._best_iter = i
                 self._best_cost = self.cost
-            if self.cost_record is not None:
-                self.cost_record.update({i: self.cost})
             if self._verbose>1:
                 print("Cost(i={}): {:.5f}".format(i, self.cost))
 
+        # Coherencia temporal con el snapshot anterior
+        if self._temporal_anchor is not None and self._temporal_weight>0:
+            grad += 2*self._temporal_weight*(self.embed[rows]-self._temporal_anchor[rows])
+        
         # Calculo de nuevo embed
-        grad = gradient(p, q, self.embed, embed_dist)
-        self._update = momentum*self._update - grad*self.__lr
-        self.embed += self._update
+        grad_norm = np.linalg.norm(grad)
+        if self._gains is not None:
+            # El gradiente mantiene la direccion de la actualizacion previa cuando tienen signos opuestos
+            keeps_direction = self._update[rows]*grad < 0.
+            self._gains[rows] = np.where(keeps_direction, self._gains[rows]+0.2, self._gains[rows]*0.8)
+            np.clip(self._gains, self._min_gain, None, out=self._gains)
+            grad *= self._gains[rows]
+        self._update[rows] = momentum*self._update[rows] - grad*self.__lr
+        self.embed[rows] += self._update[rows]
         if self.embedding_record is not None:
             self.embedding_record.append(self.embed.copy())
+        now = time.perf_counter()
+        self.history.append(i, cost=self.cost if checked else np.nan, grad_norm=grad_norm, step_size=float(np.sqrt(np.square(self._update[rows]).sum(axis=1)).mean()),
+                            spread=_spread(self.embed), time=now-self._last_record_time)
+        self._last_record_time = now
+        
+        # Callbacks: una vista de solo lectura, sin copiar el embedding
+        if len(self._callbacks)>0 and i%self._callback_every==0:
+            view = self.embed.view()
+            view.flags.writeable = False
+            stop = [callback(i, view, float(grad_norm), self.cost if checked else None) for callback in self._callbacks]
+            if any(stop):
+                self._stop_iter = i
+                if self._verbose>1:
+                    print("Stopped at i={}: requested by a callback".format(i))
+        
+        # Parada temprana (solo tras la fase de exageracion)
+        if i>=self._momentum_threshold:
+            if grad_norm<self._min_grad_norm:
+                self._stop_iter = i
+                if self._verbose>1:
+                    print("Stopped at i={}: gradient norm {:.3e} below min_grad_norm".format(i, grad_norm))
+            elif self._n_iter_without_progress is not None and i-max(self._best_iter, self._momentum_threshold)>=self._n_iter_without_progress:
+                self._stop_iter = i
+                if self._verbose>1:
+                    print("Stopped at i={}: no progress in the last {} iterations".format(i, self._n_iter_without_progress))
+        
+        if self._checkpoint_path is not None and (i+1)%self._checkpoint_every==0:
+            self.__save_checkpoint(i)
+    def __gradient(self, p) -> tuple[np.ndarray, float]:
+        # Devuelve el gradiente y la normalizacion de Q, que necesita el coste
+        if self.engine_used=="fft":
+            return engines.gradient_fft(p, self.embed)
+        elif self.engine_used=="sparse":
+            return engines.gradient_sparse(p, self.embed, backend=self._backend)
+        elif self.engine_used=="sampling":
+            return engines.gradient_sampling(p, self.embed, n_negatives=self._n_negatives, rng=self._rng)
+        elif self._backend=="numba":
+            return kernels.gradient_exact(p, self.embed)
+        return engines.gradient_exact(p, self.embed, n_threads=self._n_jobs, pool=self.__pool)
+    def __kl_divergence(self, p, z) -> float:
+        if self.engine_used!="exact":
+            return engines.kl_divergence_sparse(p, self.embed, z)
+        elif self._backend=="numba":
+            return kernels.kl_divergence_exact(p, self.embed, z)
+        return engines.kl_divergence_exact(p, self.embed, z, n_threads=self._n_jobs, pool=self.__pool)
+    @contextmanager
+    def __tile_pool(self):
+        # Un solo pool de hilos para los tiles del motor exacto durante todo el descenso, en lugar de uno por llamada
+        n_threads = os.cpu_count() if self._n_jobs is None else self._n_jobs
+        if self.engine_used!="exact" or self._backend=="numba" or n_threads<=1:
+            yield
+            return
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            self.__pool = pool
+            try:
+                yield
+            finally:
+                self.__pool = None
+    def _cost(self, p) -> float:
+        """Compute the cost of the current embedding for the joint probabilities P, with the engine in use.
+        """
+        with self.__timer.phase("cost"):
+            if self.engine_used!="exact" and self._cost_pairs is not None:
+                z = engines.normalization_sampled(self.embed, n_pairs=self._cost_pairs, rng=self._rng)
+            else:
+                _, z = self.__gradient(p)
+            return self.__kl_divergence(p, z)
+    def __frames(self, start_iter, stop_iter):
+        for i in range(start_iter, stop_iter):
+            if self._stop_iter is not None:
+                return
+            yield i
+    def __init_anim(self):
+        # El embedding inicial ya esta dibujado; evita que FuncAnimation consuma la primera iteracion
+        return []
     def __update_anim(self, i, affinities, ax:Axes):
         self.__update_embed(i, affinities)
-        
+        with self.__timer.phase("rendering"):
+            self.__draw_embed(ax, "Current Iteration: {}/{} \n Best cost: i={}, cost={:.3f}".format(i+1, self.n_iter, self._best_iter, self._best_cost))
+    def __draw_embed(self, ax:Axes, title):
         #===Plotting===============================================================================
         ax.clear()
         
@@ -549,7 +1561,140 @@ class TSne():
             ax.add_artist(leg)
 
         # Title
-        plt.title("Current Iteration: {}/{} \n Best cost: i={}, cost={:.3f}".format(i+1, self.n_iter, self._best_iter, self._best_cost))
+        plt.title(title)
+
+    def transform(self, input, labels=None, *, n_iter=250, learning_rate=1., batch_size=1024, animate=False, gif_filename=None, gif_kwargs=None) -> np.ndarray:
+        """Embed new samples into the current embedding, which is left unchanged.
+
+        The affinities of each new sample to its nearest neighbors in the fitted data
+        are searched starting from the precision of those neighbors, and only the
+        coordinates of the new samples are optimized, in batches.
+        
+        Parameters
+        ----------
+        input: array-like of shape (n_new_samples, n_features).
+            The new data to embed.
+            If metric is 'precomputed', the distances from each new sample to every fitted sample,
+            of shape (n_new_samples, n_samples).
+        
+        labels: None or array-like of shape (n_new_samples,).
+            Array with the labels of the new samples, used to color them in the animation.
+        
+        n_iter : int, default=250
+            Number of iterations of the optimization of the new samples.
+        
+        learning_rate : float, default=1.
+            The learning rate of the optimization of the new samples.
+            Each new sample is optimized on its own, so it is much lower than the one used in fit.
+        
+        batch_size : int, default=1024
+            Number of new samples processed at the same time.
+            Memory use grows with batch_size*n_samples.
+        
+        animate : boolean, default=False.
+            If True, the new samples are displayed settling in over the fitted embedding.
+        
+        gif_filename: str or None. default=None. Optional.
+            If animate is True, the file to output the animation to.
+            If None, the animation is displayed once
+        
+        gif_kwargs: dict
+            Additional keyword arguments for the gif save method.
+
+        Returns
+        -------
+        embedding : ndarray of shape (n_new_samples, n_dimensions)
+            The coordinates of the new samples in the embedding.
+        """
+        assert self.embed is not None and self._betas is not None, "The model must be fitted before transforming new data"
+        _assert_input("n_iter", n_iter, "int", more_equal=1)
+        _assert_input("learning_rate", learning_rate, "number", more=0.)
+        _assert_input("batch_size", batch_size, "int", more_equal=1)
+        assert _is_array_like(input), "The given input is not array-like"
+        X_new = np.array(input)
+        if X_new.ndim>2:
+            X_new = X_new.reshape((len(X_new), np.prod(X_new.shape[1:])))
+        
+        #====Vecinos en los datos ajustados======================================================================================================================
+        n_train = len(self.embed)
+        k = min(n_train, 3*int(self._perplexity))
+        if self._metric=="precomputed":
+            assert X_new.ndim==2 and X_new.shape[1]==n_train, "When metric is 'precomputed', input data must be the distances to every fitted sample"
+            neighbors = np.argpartition(X_new, k-1, axis=1)[:, :k]
+            neighbor_dists = np.take_along_axis(X_new, neighbors, axis=1)
+        else:
+            assert X_new.ndim==2 and X_new.shape[1]==self._X.shape[1], "The new data must have the same number of features as the fitted data"
+            if self._knn_forest is None:
+                self._knn_forest = similarities.knn_forest_add([], self._X, 0)
+            neighbor_dists, neighbors = similarities.knn_forest_query(self._knn_forest, X_new, k)
+
+        # La busqueda de cada beta parte de la de sus vecinos
+        p, _ = similarities.conditional_probabilities_knn(neighbor_dists, self._perplexity, self._perplexity_tolerance,
+                                                          betas=np.median(self._betas[neighbors], axis=1), backend=self._backend)
+        
+        #====Descenso de gradiente===============================================================================================================================
+        # Cada muestra nueva empieza en la media de sus vecinos ponderada por P
+        embed_new = np.einsum("ik,ikd->id", p, self.embed[neighbors]).astype(self._dtype, copy=False)
+        state = {
+            "p": p,
+            "neighbors": neighbors,
+            "embed": embed_new,
+            "update": np.zeros_like(embed_new),
+            "gains": np.ones_like(embed_new) if self._adaptive_gains else None,
+            "learning_rate": learning_rate,
+            "batch_size": batch_size,
+        }
+
+        if not animate:
+            for i in range(n_iter):
+                self.__update_transform(i, state)
+            return embed_new
+        
+        self.__init_plotting()
+        colors = np.zeros(len(X_new), dtype=int) if labels is None else np.unique(np.array(labels, dtype=np.str_), return_inverse=True)[1]
+        ani = animation.FuncAnimation(self._plotting_fig, self.__update_transform_anim, n_iter, init_func=self.__init_anim, fargs=[state, colors, n_iter, self._plotting_ax], cache_frame_data=False, interval=100, repeat=False)
+        if gif_filename is None:
+            plt.show()
+        else:
+            ani.save(gif_filename, **({} if gif_kwargs is None else gif_kwargs))
+        return embed_new
+    def __update_transform(self, i, state):
+        embed_new = state["embed"]
+        for start in range(0, len(embed_new), state["batch_size"]):
+            batch = slice(start, start+state["batch_size"])
+            y = embed_new[batch]
+
+            # Cada muestra nueva tiene su propia Q, normalizada sobre las muestras ajustadas
+            w = 1/(1+similarities.pairwise_euclidean_distance_to(y, self.embed))
+            z = w.sum(axis=1, keepdims=True)
+            w_neighbors = np.take_along_axis(w, state["neighbors"][batch], axis=1)
+            y_neighbors = self.embed[state["neighbors"][batch]]
+            attraction = np.einsum("ik,ikd->id", state["p"][batch]*w_neighbors, y[:, None, :]-y_neighbors)
+            w2 = np.square(w)/z
+            repulsion = y*w2.sum(axis=1, keepdims=True) - w2 @ self.embed
+            grad = 4*(attraction - repulsion)
+
+            update = state["update"][batch]
+            if state["gains"] is not None:
+                gains = state["gains"][batch]
+                keeps_direction = update*grad < 0.
+                gains[...] = np.clip(np.where(keeps_direction, gains+0.2, gains*0.8), self._min_gain, None)
+                grad *= gains
+            update[...] = self._momentum_end*update - state["learning_rate"]*grad
+            y += update
+    def __update_transform_anim(self, i, state, colors, n_iter, ax:Axes):
+        self.__update_transform(i, state)
+
+        #===Plotting===============================================================================
+        ax.clear()
+        embed_new = state["embed"]
+        if self._n_dimensions==2:
+            ax.scatter(self.embed.T[0], self.embed.T[1], c=self._plotting_colors, s=self._plotting_size, alpha=0.2)
+            ax.scatter(embed_new.T[0], embed_new.T[1], c=colors, marker='x', s=4*self._plotting_size)
+        else:
+            ax.scatter(self.embed.T[0], self.embed.T[1], self.embed.T[2], c=self._plotting_colors, s=self._plotting_size, alpha=0.2)
+            ax.scatter(embed_new.T[0], embed_new.T[1], embed_new.T[2], c=colors, marker='x', s=4*self._plotting_size)
+        plt.title("New samples, iteration: {}/{}".format(i+1, n_iter))
 
     def get_best_embed_info(self):
         """Returns the best cost achieved and the iteration it belongs to
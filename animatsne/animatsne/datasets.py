@@ -0,0 +1,222 @@
+import numpy as np
+
+def make_blobs(n_samples=1000, n_features=50, *, n_clusters=10, cluster_std=1., center_box=10., seed:int=None) -> tuple[np.ndarray, np.ndarray]:
+    """Generate isotropic Gaussian clusters.
+
+    Parameters
+    ----------
+    n_samples : int, default=1000
+        The number of samples.
+
+    n_features : int, default=50
+        The number of features of each sample.
+
+    n_clusters : int, default=10
+        The number of clusters. Each sample is assigned to one of them uniformly at random.
+
+    cluster_std : float, default=1.
+        The standard deviation of every cluster.
+
+    center_box : float, default=10.
+        The centers are drawn uniformly from the hypercube [0, center_box]^n_features.
+
+    seed : int or None, default=None
+        Seed of the random generator.
+
+    Returns
+    -------
+    X : ndarray of shape (n_samples, n_features)
+        The samples.
+
+    labels : ndarray of shape (n_samples,)
+        The cluster of each sample.
+    """
+    rng = np.random.default_rng(seed)
+    centers = center_box*rng.random((n_clusters, n_features))
+    labels = rng.integers(n_clusters, size=n_samples)
+    X = rng.standard_normal((n_samples, n_features))
+    X *= cluster_std
+    X += centers[labels]
+    return X, labels
+
+def make_nested_manifolds(n_samples=1000, n_features=10, *, n_manifolds=3, manifold_dim=2, noise=0.05, seed:int=None) -> tuple[np.ndarray, np.ndarray]:
+    """Generate concentric spheres, embedded in a random subspace of a higher dimensional space.
+
+    The sphere k (from 0) has radius k+1. The spheres cannot be separated by any linear projection,
+    so they test whether the local structure is kept.
+
+    Parameters
+    ----------
+    n_samples : int, default=1000
+        The number of samples. They are split among the spheres in proportion to their area.
+
+    n_features : int, default=10
+        The number of features of each sample. Must be greater than manifold_dim.
+
+    n_manifolds : int, default=3
+        The number of spheres.
+
+    manifold_dim : int, default=2
+        The intrinsic dimension of every sphere, which lies in a subspace of dimension manifold_dim+1.
+
+    noise : float, default=0.05
+        The standard deviation of the Gaussian noise added to every feature.
+
+    seed : int or None, default=None
+        Seed of the random generator.
+
+    Returns
+    -------
+    X : ndarray of shape (n_samples, n_features)
+        The samples.
+
+    labels : ndarray of shape (n_samples,)
+        The sphere of each sample.
+    """
+    assert n_features>manifold_dim, "n_features must be greater than manifold_dim"
+    rng = np.random.default_rng(seed)
+    # Area proporcional a radio^manifold_dim: la densidad de muestras es la misma en todas las esferas
+    radii = np.arange(1, n_manifolds+1, dtype=float)
+    labels = rng.choice(n_manifolds, size=n_samples, p=radii**manifold_dim/np.sum(radii**manifold_dim))
+    # Puntos uniformes en la esfera: normales normalizadas
+    points = rng.standard_normal((n_samples, manifold_dim+1))
+    points *= (radii[labels]/np.linalg.norm(points, axis=1))[:, np.newaxis]
+    # Base ortonormal aleatoria del subespacio
+    basis, _ = np.linalg.qr(rng.standard_normal((n_features, manifold_dim+1)))
+    X = points @ basis.T
+    X += noise*rng.standard_normal((n_samples, n_features))
+    return X, labels
+
+def make_hierarchical_clusters(n_samples=1000, n_features=50, *, branching=(3, 3), spread=10., ratio=0.25, cluster_std=None, seed:int=None) -> tuple[np.ndarray, np.ndarray]:
+    """Generate Gaussian clusters whose centers are organized in a tree.
+
+    The centers of each level are drawn around the centers of their parents with a standard deviation
+    ratio times that of the previous level, so the clusters form groups of groups.
+
+    Parameters
+    ----------
+    n_samples : int, default=1000
+        The number of samples. Each one is assigned to one of the leaves uniformly at random.
+
+    n_features : int, default=50
+        The number of features of each sample.
+
+    branching : sequence of int, default=(3, 3)
+        The number of children of every node of each level. There are prod(branching) leaves.
+
+    spread : float, default=10.
+        The standard deviation of the centers of the first level, around the origin.
+
+    ratio : float, default=0.25
+        The standard deviation of the centers of each level relative to that of the previous one.
+
+    cluster_std : float or None, default=None
+        The standard deviation of the samples around the center of their leaf.
+        If None, ratio times that of the centers of the last level.
+
+    seed : int or None, default=None
+        Seed of the random generator.
+
+    Returns
+    -------
+    X : ndarray of shape (n_samples, n_features)
+        The samples.
+
+    labels : ndarray of shape (n_samples,)
+        The leaf of each sample. The leaves are numbered in depth-first order, so the group
+        of a sample at the first level is labels//prod(branching[1:]).
+    """
+    rng = np.random.default_rng(seed)
+    centers = np.zeros((1, n_features))
+    std = spread
+    for b in branching:
+        # Cada centro se repite b veces, una por hijo
+        centers = np.repeat(centers, b, axis=0) + std*rng.standard_normal((len(centers)*b, n_features))
+        std *= ratio
+    cluster_std = std if cluster_std is None else cluster_std
+    labels = rng.integers(len(centers), size=n_samples)
+    X = rng.standard_normal((n_samples, n_features))
+    X *= cluster_std
+    X += centers[labels]
+    return X, labels
+
+def make_mnist_like(n_samples=1000, *, n_classes=10, image_size=28, n_strokes=4, n_modes=8, noise=20., dtype=np.uint8, seed:int=None) -> tuple[np.ndarray, np.ndarray]:
+    """Generate a high dimensional mixture that resembles MNIST: flattened grayscale images with values in [0, 255].
+
+    Each class has a prototype image made of a few blurred strokes and a few modes of variation,
+    also blurred strokes. Every sample is its prototype plus a random combination of the modes
+    and pixel noise, clipped to [0, 255]. As in MNIST, the border of the images is mostly 0
+    and the samples of each class lie close to a low dimensional subspace.
+
+    Parameters
+    ----------
+    n_samples : int, default=1000
+        The number of samples. Each one is assigned to a class uniformly at random.
+
+    n_classes : int, default=10
+        The number of classes.
+
+    image_size : int, default=28
+        The width and height of the images. Each sample has image_size**2 features.
+
+    n_strokes : int, default=4
+        The number of strokes of each prototype.
+
+    n_modes : int, default=8
+        The number of modes of variation of each class.
+
+    noise : float, default=20.
+        The standard deviation of the noise added to every pixel.
+
+    dtype : data-type, default=np.uint8
+        The type of the returned samples. The values are rounded if it is an integer type.
+
+    seed : int or None, default=None
+        Seed of the random generator.
+
+    Returns
+    -------
+    X : ndarray of shape (n_samples, image_size**2)
+        The samples.
+
+    labels : ndarray of shape (n_samples,)
+        The class of each sample.
+    """
+    rng = np.random.default_rng(seed)
+    prototypes = _strokes(rng, (n_classes, n_strokes), image_size)
+    prototypes *= 255/prototypes.max(axis=1, keepdims=True)
+    modes = _strokes(rng, (n_classes, n_modes, 1), image_size)
+    # Los modos añaden y quitan tinta: media cero y la misma escala que los prototipos
+    modes -= modes.mean(axis=2, keepdims=True)
+    modes *= 80/modes.std(axis=2, keepdims=True)
+
+    labels = rng.integers(n_classes, size=n_samples)
+    X = np.empty((n_samples, image_size**2))
+    for c in range(n_classes):
+        index = np.flatnonzero(labels==c)
+        X[index] = rng.standard_normal((len(index), n_modes)) @ (modes[c]/np.sqrt(n_modes))
+        X[index] += prototypes[c]
+    X += noise*rng.standard_normal(X.shape)
+    # Fondo a 0, como en MNIST
+    np.clip(X-40, 0, 255, out=X)
+    if np.issubdtype(dtype, np.integer):
+        np.rint(X, out=X)
+    return X.astype(dtype, copy=False), labels
+
+def _strokes(rng:np.random.Generator, shape, image_size) -> np.ndarray:
+    # Imagenes aplanadas de forma shape[:-1]+(image_size**2,), cada una la suma de shape[-1] trazos:
+    # segmentos con extremos en la zona central, difuminados con un nucleo gaussiano
+    n_points = 2*image_size
+    start = rng.uniform(0.2, 0.8, shape+(2,))
+    stop = rng.uniform(0.2, 0.8, shape+(2,))
+    t = np.linspace(0, 1, n_points)[:, np.newaxis]
+    points = start[..., np.newaxis, :] + t*(stop-start)[..., np.newaxis, :]
+    points = points.reshape(shape[:-1]+(shape[-1]*n_points, 2))
+
+    grid = (np.arange(image_size)+0.5)/image_size
+    width = 1.5/image_size
+    # Nucleo separable: exp(-(dx^2+dy^2)/(2w^2)) = exp(-dx^2/(2w^2))*exp(-dy^2/(2w^2))
+    kx = np.exp(-(points[..., 0, np.newaxis]-grid)**2/(2*width**2))
+    ky = np.exp(-(points[..., 1, np.newaxis]-grid)**2/(2*width**2))
+    images = np.einsum("...pi,...pj->...ij", ky, kx)
+    return images.reshape(shape[:-1]+(image_size**2,))
@@ -0,0 +1,635 @@
+import numpy as np
+import itertools
+import os
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from . import similarities
+#===Exact P================================================================
+def gradient_exact(P:np.ndarray, y:np.ndarray, *, block_size=None, n_threads=None, pool=None) -> tuple[np.ndarray, float]:
+    """Compute the gradient of the cost function for a dense P, by tiles of rows processed in a pool of threads.
+
+    Each tile computes the distances, the kernel (1+d_ij)^-1, its contribution to the normalization of Q
+    and the unnormalized forces of its rows, so Q is never stored and the memory needed grows with
+    n_threads*block_size*n_samples instead of n_samples^2. NumPy releases the GIL in the
+    operations of each tile, so they run in parallel.
+
+    If P is condensed, each tile only covers the pairs (i, j) with j>i of its rows, and
+    the forces of every pair are added to both of its samples, so each pair is computed once.
+
+    Parameters
+    ----------
+    P : ndarray of shape (n_samples, n_samples) or (n_samples*(n_samples-1)/2,)
+        The joint probabilities in the original space, square or condensed.
+
+    y : ndarray of shape (n_samples, n_dimensions)
+        The current embedding.
+
+    block_size : int or None, default=None
+        Number of rows of each tile. If None, as many as fit in about 2MB per array of the tile.
+
+    n_threads : int or None, default=None
+        Number of threads. If None, the number of processors of the machine.
+
+    pool : concurrent.futures.ThreadPoolExecutor or None, default=None
+        The pool of threads that runs the tiles, so it can be reused through the iterations of a descent.
+        If None, a pool of n_threads threads is created for this call.
+
+    Returns
+    -------
+    gradient : ndarray of shape (n_samples, n_dimensions)
+        The gradient of the cost function.
+
+    z : float
+        The normalization of Q, that is, the sum of (1+d_ij)^-1 for every pair of points i!=j.
+    """
+    if P.ndim==1:
+        attraction = np.zeros_like(y)
+        repulsion = np.zeros_like(y)
+        tile = partial(_gradient_tile_condensed, P, y, similarities.condensed_offsets(len(y)), attraction, repulsion, threading.Lock())
+    else:
+        attraction = np.empty_like(y)
+        repulsion = np.empty_like(y)
+        tile = partial(_gradient_tile, P, y, attraction, repulsion)
+    z = sum(_map_tiles(tile, len(y), y.dtype.itemsize, block_size, n_threads, pool))
+    return 4*(attraction - repulsion/y.dtype.type(z)), z
+
+def kl_divergence_exact(P:np.ndarray, y:np.ndarray, z:float, *, block_size=None, n_threads=None, pool=None) -> float:
+    """Computes the Kullback-Leibler divergence for a dense P by tiles of rows, without storing Q.
+
+    Parameters
+    ----------
+    P : ndarray of shape (n_samples, n_samples) or (n_samples*(n_samples-1)/2,)
+        The joint probabilities in the original space, square or condensed.
+
+    y : ndarray of shape (n_samples, n_dimensions)
+        The current embedding.
+
+    z : float
+        The normalization of Q, as returned by gradient_exact.
+
+    block_size, n_threads, pool
+        Like in gradient_exact.
+
+    Returns
+    -------
+    divergence : double.
+        The divergence.
+    """
+    # log(p/q) = log(p*(1+d)) + log(z)
+    if P.ndim==1:
+        tile = partial(_kl_divergence_tile_condensed, P, y, similarities.condensed_offsets(len(y)))
+    else:
+        tile = partial(_kl_divergence_tile, P, y)
+    partials = _map_tiles(tile, len(y), y.dtype.itemsize, block_size, n_threads, pool)
+    return sum(c for c, _ in partials) + np.log(z)*sum(t for _, t in partials)
+
+def _map_tiles(function, n, itemsize, block_size, n_threads, pool=None) -> list:
+    if block_size is None:
+        block_size = max(8, 2**21//(n*itemsize))
+    tiles = [(start, min(start+block_size, n)) for start in range(0, n, block_size)]
+    if pool is not None and len(tiles)>1:
+        return list(pool.map(lambda tile: function(*tile), tiles))
+    n_threads = os.cpu_count() if n_threads is None else n_threads
+    if n_threads<=1 or len(tiles)==1:
+        return [function(*tile) for tile in tiles]
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        return list(pool.map(lambda tile: function(*tile), tiles))
+
+def _tile_kernel(y, start, stop, col_start=0) -> np.ndarray:
+    # (1+d_ij)^-1 de las filas del tile con las muestras desde col_start, sin la diagonal
+    w = np.zeros((stop-start, len(y)-col_start), dtype=y.dtype)
+    for k in range(y.shape[1]):
+        diff = np.subtract.outer(y[start:stop, k], y[col_start:, k])
+        w += np.square(diff, out=diff)
+    w += 1
+    np.reciprocal(w, out=w)
+    w[np.arange(stop-start), np.arange(start, stop)-col_start] = 0.
+    return w
+
+def _condensed_tile(P, y, offsets, start, stop) -> tuple[np.ndarray, np.ndarray]:
+    # Pares (i, j) con j>i de las filas del tile, en las columnas [start, n): la parte inferior queda a 0.
+    # Las filas del tile son un tramo contiguo de P condensada, en el mismo orden que las posiciones de upper
+    w = _tile_kernel(y, start, stop, start)
+    upper = np.arange(w.shape[1]) > np.arange(stop-start)[:, None]
+    w[~upper] = 0.
+    p = np.zeros_like(w)
+    p[upper] = P[offsets[start]:offsets[start]+np.count_nonzero(upper)]
+    return p, w
+
+def _pair_forces(c, y_rows, y_cols) -> np.ndarray:
+    # c_ij*(y_i-y_j) sobre cada fila i y la fuerza opuesta sobre cada columna j
+    forces = y_cols*c.sum(axis=0, dtype=np.float64)[:, None] - c.T@y_rows
+    forces[:len(y_rows)] += y_rows*c.sum(axis=1, keepdims=True, dtype=np.float64) - c@y_cols
+    return forces
+
+def _gradient_tile(P, y, attraction, repulsion, start, stop) -> float:
+    y_tile = y[start:stop]
+    w = _tile_kernel(y, start, stop)
+    z = float(w.sum(dtype=np.float64))
+    pw = np.multiply(P[start:stop], w, dtype=y.dtype)
+    attraction[start:stop] = y_tile*pw.sum(axis=1, keepdims=True, dtype=np.float64) - pw@y
+    del pw
+    np.square(w, out=w)
+    repulsion[start:stop] = y_tile*w.sum(axis=1, keepdims=True, dtype=np.float64) - w@y
+    return z
+
+def _gradient_tile_condensed(P, y, offsets, attraction, repulsion, lock, start, stop) -> float:
+    p, w = _condensed_tile(P, y, offsets, start, stop)
+    z = 2*float(w.sum(dtype=np.float64))
+    y_rows, y_cols = y[start:stop], y[start:]
+    p *= w
+    forces_attraction = _pair_forces(p, y_rows, y_cols)
+    del p
+    np.square(w, out=w)
+    forces_repulsion = _pair_forces(w, y_rows, y_cols)
+    # Las columnas de un tile son filas de otros: la suma se hace de uno en uno
+    with lock:
+        attraction[start:] += forces_attraction
+        repulsion[start:] += forces_repulsion
+    return z
+
+def _kl_divergence_tile_condensed(P, y, offsets, start, stop) -> tuple[float, float]:
+    p, w = _condensed_tile(P, y, offsets, start, stop)
+    cond = p!=0.
+    return 2*float(np.sum(p[cond]*np.log(p[cond]/w[cond]), dtype=np.float64)), 2*float(p.sum(dtype=np.float64))
+
+def _kl_divergence_tile(P, y, start, stop) -> tuple[float, float]:
+    p = np.asarray(P[start:stop])
+    w = _tile_kernel(y, start, stop)
+    cond = p!=0.
+    return float(np.sum(p[cond]*np.log(p[cond]/w[cond]), dtype=np.float64)), float(p.sum(dtype=np.float64))
+
+#===Sparse P===============================================================
+def gradient_sparse(P, y:np.ndarray, *, block_size=1024, backend="numpy") -> tuple[np.ndarray, float]:
+    """Compute the gradient of the cost function when P is a sparse matrix.
+
+    The attractive forces are computed only for the nonzero entries of P.
+    The repulsive forces are computed exactly, by blocks of rows, so the memory
+    needed grows with block_size*n_samples instead of n_samples^2.
+
+    Parameters
+    ----------
+    P : sparse matrix of shape (n_samples, n_samples)
+        The joint probabilities in the original space.
+
+    y : ndarray of shape (n_samples, n_dimensions)
+        The current embedding.
+
+    block_size : int, default=1024
+        Number of rows of the embedding whose repulsive forces are computed at the same time.
+
+    backend : str, default='numpy'
+        If 'numba', the compiled kernel of animatsne.kernels is used, which needs no blocks.
+
+    Returns
+    -------
+    gradient : ndarray of shape (n_samples, n_dimensions)
+        The gradient of the cost function.
+
+    z : float
+        The normalization of Q, that is, the sum of (1+d_ij)^-1 for every pair of points i!=j.
+    """
+    if backend=="numba":
+        from . import kernels
+        return kernels.gradient_sparse(P, y)
+    attraction = _attraction_sparse(P, y)
+
+    n = len(y)
+    repulsion = np.empty_like(y)
+    z = 0.
+    for start in range(0, n, block_size):
+        stop = min(start+block_size, n)
+        y_block = y[start:stop]
+        w = 1/(1+similarities.pairwise_euclidean_distance_to(y_block, y, dtype=y.dtype))
+        w[np.arange(stop-start), np.arange(start, stop)] = 0.
+        z += float(w.sum(dtype=np.float64))
+        w2 = np.square(w)
+        repulsion[start:stop] = y_block*w2.sum(axis=1, keepdims=True) - w2 @ y
+    return 4*(attraction - repulsion/z), z
+
+def _attraction_sparse(P, y:np.ndarray) -> np.ndarray:
+    P = P.tocoo()
+    diff = y[P.row]-y[P.col]
+    weights = P.data/(1+np.square(diff).sum(axis=1))
+    result = np.empty_like(y)
+    for d in range(y.shape[1]):
+        result[:, d] = np.bincount(P.row, weights=weights*diff[:, d], minlength=len(y))
+    return result
+
+def gradient_rows(P, y:np.ndarray, rows:np.ndarray, z_fixed:float, *, block_size=1024) -> tuple[np.ndarray, float]:
+    """Compute the gradient of the cost function for some rows of the embedding, with the other rows fixed.
+
+    The forces on those rows are computed exactly, so the cost grows with len(rows)*n_samples instead of n_samples^2.
+    The normalization of Q only needs the pairs with one of the rows: the rest of it, z_fixed, does not change.
+
+    Parameters
+    ----------
+    P : sparse matrix of shape (n_samples, n_samples)
+        The joint probabilities in the original space.
+
+    y : ndarray of shape (n_samples, n_dimensions)
+        The current embedding.
+
+    rows : ndarray of shape (n_rows,)
+        The indices of the rows whose gradient is computed, without repetitions.
+
+    z_fixed : float
+        The sum of (1+d_ij)^-1 for every pair of fixed points i!=j.
+
+    block_size : int, default=1024
+        Number of rows whose repulsive forces are computed at the same time.
+
+    Returns
+    -------
+    gradient : ndarray of shape (n_rows, n_dimensions)
+        The gradient of the cost function for the given rows.
+
+    z : float
+        The normalization of Q, that is, the sum of (1+d_ij)^-1 for every pair of points i!=j.
+    """
+    P = P.tocsr()[rows].tocoo()
+    diff = y[rows[P.row]]-y[P.col]
+    weights = P.data/(1+np.square(diff).sum(axis=1))
+    attraction = np.empty((len(rows), y.shape[1]), dtype=y.dtype)
+    for d in range(y.shape[1]):
+        attraction[:, d] = np.bincount(P.row, weights=weights*diff[:, d], minlength=len(rows))
+
+    repulsion = np.empty_like(attraction)
+    # Pares con alguna fila movil: z_rows los cuenta una vez si el otro punto es fijo y dos si tambien es movil
+    z_rows = 0.
+    z_both = 0.
+    for start in range(0, len(rows), block_size):
+        stop = min(start+block_size, len(rows))
+        y_block = y[rows[start:stop]]
+        w = 1/(1+similarities.pairwise_euclidean_distance_to(y_block, y, dtype=y.dtype))
+        w[np.arange(stop-start), rows[start:stop]] = 0.
+        z_rows += float(w.sum(dtype=np.float64))
+        z_both += float(w[:, rows].sum(dtype=np.float64))
+        w2 = np.square(w)
+        repulsion[start:stop] = y_block*w2.sum(axis=1, keepdims=True) - w2 @ y
+    z = z_fixed + 2*z_rows - z_both
+    return 4*(attraction - repulsion/z), z
+
+def kl_divergence_sparse(P, y:np.ndarray, z:float) -> float:
+    """Computes the Kullback-Leibler divergence when P is a sparse matrix
+
+    Only the nonzero entries of P contribute to the divergence, so Q only needs to be known
+    for those entries and through its normalization.
+
+    Parameters
+    ----------
+    P : sparse matrix of shape (n_samples, n_samples)
+        The joint probabilities in the original space.
+
+    y : ndarray of shape (n_samples, n_dimensions)
+        The current embedding.
+
+    z : float
+        The normalization of Q, as returned by gradient_sparse.
+
+    Returns
+    -------
+    divergence : double.
+        The divergence.
+    """
+    P = P.tocoo()
+    cond = P.data!=0.
+    p = P.data[cond]
+    q = 1/(1+np.square(y[P.row[cond]]-y[P.col[cond]]).sum(axis=1))/z
+    return np.sum(p*np.log(p/q), dtype=np.float64)
+
+def normalization_sampled(y:np.ndarray, *, n_pairs=100000, rng=None) -> float:
+    """Estimate the normalization of Q from random pairs of points, without computing any forces.
+
+    Together with kl_divergence_sparse, it gives the cost for a sparse P without the repulsive forces.
+
+    Parameters
+    ----------
+    y : ndarray of shape (n_samples, n_dimensions)
+        The current embedding.
+
+    n_pairs : int, default=100000
+        Number of pairs of points drawn. If there are not more pairs than that, the normalization is exact.
+
+    rng : numpy.random.Generator or None, default=None
+        The generator of the pairs. If None, a new one without a seed.
+
+    Returns
+    -------
+    z : float
+        The estimated normalization of Q, that is, the sum of (1+d_ij)^-1 for every pair of points i!=j.
+    """
+    n = len(y)
+    if n*(n-1)<=n_pairs:
+        w = 1/(1+similarities.pairwise_euclidean_distance(y, condensed=True))
+        return 2*float(w.sum(dtype=np.float64))
+    rng = np.random.default_rng() if rng is None else rng
+    first = rng.integers(0, n, n_pairs)
+    second = rng.integers(0, n-1, n_pairs)
+    second += second>=first
+    w = 1/(1+np.square(y[first]-y[second]).sum(axis=1))
+    return n*(n-1)*float(w.mean(dtype=np.float64))
+
+#===FFT interpolation======================================================
+def gradient_fft(P, y:np.ndarray, *, grid_spacing=0.5, max_grid_size=None) -> tuple[np.ndarray, float]:
+    """Compute the gradient of the cost function when P is a sparse matrix, approximating the repulsive forces.
+
+    The attractive forces are computed only for the nonzero entries of P.
+    The repulsive forces are interpolated from a regular grid: every point spreads its charge
+    to the 4^n_dimensions nodes around it (cubic Lagrange interpolation), the kernels (1+d^2)^-1 and (1+d^2)^-2 are convolved
+    with the charges through FFTs, and the potentials are interpolated back to the points.
+    The cost grows with n_samples plus the size of the grid, instead of n_samples^2.
+
+    Parameters
+    ----------
+    P : sparse matrix of shape (n_samples, n_samples)
+        The joint probabilities in the original space.
+
+    y : ndarray of shape (n_samples, n_dimensions)
+        The current embedding. Only 2 or 3 dimensions are supported.
+
+    grid_spacing : float, default=0.5
+        Distance between the nodes of the grid, in units of the embedding.
+        It grows if the embedding is too wide for max_grid_size nodes.
+
+    max_grid_size : int or None, default=None
+        Maximum number of nodes of the grid along each dimension.
+        If None, 1024 for 2 dimensions and 64 for 3.
+
+    Returns
+    -------
+    gradient : ndarray of shape (n_samples, n_dimensions)
+        The gradient of the cost function.
+
+    z : float
+        The approximate normalization of Q, that is, the sum of (1+d_ij)^-1 for every pair of points i!=j.
+    """
+    from scipy import fft
+    n, d = y.shape
+    assert d in [2, 3], "The fft engine only supports 2 or 3 dimensions"
+    if max_grid_size is None:
+        max_grid_size = 1024 if d==2 else 64
+    attraction = _attraction_sparse(P, y)
+
+    #===Reparto de cargas en la rejilla (interpolacion de Lagrange cubica)
+    low = y.min(axis=0)
+    extent = np.max(y.max(axis=0)-low)
+    spacing = max(grid_spacing, extent/(max_grid_size-4))
+    size = int(extent/spacing)+4
+    u = (y-low)/spacing+1
+    base = np.minimum(np.floor(u).astype(np.intp), size-3)-1
+    f = u-base-1
+    # Pesos de los nodos -1, 0, 1 y 2 de cada punto en cada dimension
+    node_weights = [-f*(f-1)*(f-2)/6, (f+1)*(f-1)*(f-2)/2, -(f+1)*f*(f-2)/2, (f+1)*f*(f-1)/6]
+    charges = np.hstack([np.ones((n, 1)), y])
+    corners = []
+    grid = np.zeros((size**d, d+1))
+    for corner in itertools.product(range(4), repeat=d):
+        weight = np.prod([node_weights[c][:, k] for k, c in enumerate(corner)], axis=0)
+        node = np.ravel_multi_index(tuple((base+corner).T), (size,)*d)
+        corners.append((node, weight))
+        for c in range(d+1):
+            grid[:, c] += np.bincount(node, weights=weight*charges[:, c], minlength=size**d)
+    grid = grid.reshape((size,)*d+(d+1,))
+
+    #===Convolucion con los nucleos (circular, con la rejilla rellenada de ceros)
+    length = fft.next_fast_len(2*size-1, real=True)
+    shape = (length,)*d
+    offsets = np.minimum(np.arange(length), length-np.arange(length))*spacing
+    dist = sum(np.square(o) for o in np.meshgrid(*([offsets]*d), indexing="ij"))
+    kernel = 1/(1+dist)
+    kernel_1 = fft.rfftn(kernel)
+    kernel_2 = fft.rfftn(np.square(kernel))
+    grid_fft = fft.rfftn(grid, s=shape, axes=range(d))
+    inner = (slice(0, size),)*d
+    potential_1 = fft.irfftn(grid_fft[..., 0]*kernel_1, s=shape)[inner].ravel()
+    potential_2 = fft.irfftn(grid_fft*kernel_2[..., None], s=shape, axes=range(d))[inner].reshape(size**d, d+1)
+
+    #===Interpolacion de vuelta a los puntos
+    phi_1 = np.zeros(n)
+    phi_2 = np.zeros((n, d+1))
+    for node, weight in corners:
+        phi_1 += weight*potential_1[node]
+        phi_2 += weight[:, None]*potential_2[node]
+    # La interaccion de cada punto consigo mismo vale 1 en z y se cancela en la repulsion
+    z = max(float(phi_1.sum())-n, np.finfo(float).tiny)
+    repulsion = y*phi_2[:, :1] - phi_2[:, 1:]
+    return (4*(attraction - repulsion/z)).astype(y.dtype, copy=False), z
+
+#===Negative sampling======================================================
+def gradient_sampling(P, y:np.ndarray, *, n_negatives=20, rng=None, block_size=65536) -> tuple[np.ndarray, float]:
+    """Estimate the gradient of the cost function from random samples of its forces.
+
+    The attractive forces of each point are estimated from n_negatives edges of its row of P, drawn with
+    probability proportional to their value, and its repulsive forces and the normalization of Q,
+    from n_negatives other points drawn uniformly. Both estimates are unbiased, and their cost grows
+    with n_negatives*n_samples, whatever the number of neighbors in P.
+
+    Parameters
+    ----------
+    P : sparse matrix of shape (n_samples, n_samples)
+        The joint probabilities in the original space.
+
+    y : ndarray of shape (n_samples, n_dimensions)
+        The current embedding.
+
+    n_negatives : int, default=20
+        Number of other points, and of edges of P, sampled per point.
+
+    rng : numpy.random.Generator or None, default=None
+        The generator of the samples. If None, a new one without a seed.
+
+    block_size : int, default=65536
+        Number of points whose repulsive forces are estimated at the same time.
+
+    Returns
+    -------
+    gradient : ndarray of shape (n_samples, n_dimensions)
+        The estimated gradient of the cost function.
+
+    z : float
+        The estimated normalization of Q, that is, the sum of (1+d_ij)^-1 for every pair of points i!=j.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    P = P.tocsr()
+    n = len(y)
+
+    # Atraccion: n_negatives aristas de cada fila i, con probabilidad p_ij/sum_j(p_ij) y peso sum_j(p_ij)/n_negatives
+    cumulative = np.cumsum(P.data, dtype=np.float64)
+    row_start = np.concatenate([[0.], cumulative])[P.indptr[:-1]]
+    row_sum = np.concatenate([[0.], cumulative])[P.indptr[1:]] - row_start
+    rows = np.repeat(np.arange(n), n_negatives)
+    edges = np.searchsorted(cumulative, row_start[rows] + rng.random(len(rows))*row_sum[rows], side="right")
+    np.clip(edges, P.indptr[rows], np.maximum(P.indptr[rows+1]-1, P.indptr[rows]), out=edges)
+    edges = np.minimum(edges, len(cumulative)-1)
+    diff = y[rows]-y[P.indices[edges]]
+    weights = (row_sum[rows]/n_negatives)/(1+np.square(diff).sum(axis=1))
+    attraction = np.empty_like(y)
+    for d in range(y.shape[1]):
+        attraction[:, d] = np.bincount(rows, weights=weights*diff[:, d], minlength=n)
+    del diff, weights
+
+    # Repulsion: n_negatives puntos distintos de i por cada i, con peso (n-1)/n_negatives
+    repulsion = np.empty_like(y)
+    scale = (n-1)/n_negatives
+    z = 0.
+    for start in range(0, n, block_size):
+        stop = min(start+block_size, n)
+        points = np.arange(start, stop)[:, None]
+        others = rng.integers(0, n-1, size=(stop-start, n_negatives))
+        others += others>=points
+        diff = y[start:stop, None, :]-y[others]
+        w = 1/(1+np.square(diff).sum(axis=2))
+        z += float(w.sum(dtype=np.float64))
+        repulsion[start:stop] = np.einsum("ij,ijk->ik", np.square(w), diff)*scale
+    z *= scale
+    return 4*(attraction - repulsion/y.dtype.type(z)), z
+
+#===Engine selection=======================================================
+ENGINES = ["exact", "sparse", "fft", "sampling"]
+
+def estimate_memory(n_samples:int, n_dimensions:int, engine:str, *, n_features=0, n_neighbors=90, block_size=1024, max_grid_size=None, n_negatives=20, itemsize=8, n_threads=None) -> int:
+    """Estimate the peak memory, in bytes, needed to fit n_samples with the given engine.
+
+    Only the arrays allocated by the fit are counted, not the input data.
+
+    Parameters
+    ----------
+    n_samples : int
+        The number of samples to fit.
+
+    n_dimensions : int
+        The number of dimensions of the embedding.
+
+    engine : str
+        One of 'exact', 'sparse', 'fft' or 'sampling'.
+
+    n_features : int, default=0
+        The number of features of the input, for the nearest neighbors index of the sparse engines.
+
+    n_neighbors : int, default=90
+        The number of neighbors of each sample in the sparse P.
+
+    block_size : int, default=1024
+        Number of rows of the repulsive forces computed at the same time by the sparse engine.
+
+    max_grid_size : int or None, default=None
+        Maximum number of nodes of the grid along each dimension for the fft engine, like in gradient_fft.
+
+    n_negatives : int, default=20
+        Number of points sampled per point by the sampling engine, like in gradient_sampling.
+
+    itemsize : int, default=8
+        Number of bytes of each value: 8 for np.float64 and 4 for np.float32.
+
+    n_threads : int or None, default=None
+        Number of threads of the exact engine, each with its own tile. If None, the number of processors of the machine.
+
+    Returns
+    -------
+    peak : int
+        The estimated number of bytes.
+    """
+    n, d, f = n_samples, n_dimensions, itemsize
+    square = n*n*f
+    if engine=="exact":
+        # P condensada: distancias condensadas y las probabilidades condicionales de las dos mitades
+        affinities = (0.5+1)*square
+        # Descenso: P (y P exagerada) condensadas y, por cada hilo, un tile con el nucleo, P*nucleo y un temporal
+        tile_rows = min(n, max(8, 2**21//(n*f)))
+        n_threads = (os.cpu_count() or 1) if n_threads is None else n_threads
+        descent = square + max(n_threads, 1)*3*tile_rows*n*f
+        return int(max(affinities, descent))
+    
+    # P dispersa: vecinos (distancias, indices y probabilidades), matriz condicional, su traspuesta y la suma
+    nnz = 2*n*n_neighbors
+    affinities = n*n_features*f + 3*n*n_neighbors*f + 3*nnz*(f+4)
+    # Descenso: P (y P exagerada) y las diferencias y pesos de las fuerzas atractivas
+    descent = 2*nnz*(f+4) + nnz*(d+2)*f + 8*n*d*f
+    if engine=="sparse":
+        descent += 3*min(block_size, n)*n*f
+    elif engine=="fft":
+        max_grid_size = (1024 if d==2 else 64) if max_grid_size is None else max_grid_size
+        # La anchura del embedding final suele ser del orden de 2*sqrt(n_samples), con nodos cada 0.5
+        size = min(max_grid_size, int(4*np.sqrt(n))+4)
+        length = 2*size
+        # Rejilla de cargas, nucleos, y sus transformadas (complejas) para d+2 canales
+        descent += (d+1)*size**d*f + 2*length**d*f + (d+4)*length**d*f + 4**d*n*2*f
+    elif engine=="sampling":
+        # Suma acumulada de P, las aristas sorteadas y, por cada bloque, los puntos sorteados, sus diferencias y pesos
+        descent += nnz*8 + n*n_negatives*(d+2)*f + min(65536, n)*n_negatives*(d+2)*f
+    else:
+        raise ValueError("Unknown engine: {}".format(engine))
+    return int(max(affinities, affinities/2 + descent))
+
+def select_engine(n_samples:int, n_dimensions:int, engine="auto", memory_limit=None, *, allow_exact=True, **kwargs) -> str:
+    """Choose the engine used to fit n_samples within a memory budget.
+
+    With engine='auto', the exact engine is chosen if it fits, then 'fft' (only for 2 or 3 dimensions),
+    and then 'sparse'. The 'sampling' engine is stochastic, so it is never chosen automatically.
+    An explicit engine is only checked against the budget.
+
+    Parameters
+    ----------
+    n_samples : int
+        The number of samples to fit.
+
+    n_dimensions : int
+        The number of dimensions of the embedding.
+
+    engine : str, default='auto'
+        One of 'auto', 'exact', 'sparse', 'fft' or 'sampling'.
+
+    memory_limit : int, float or None, default=None
+        The budget, in bytes. If None, the memory available in the system, if it can be known.
+
+    allow_exact : bool, default=True
+        If False, engine='auto' only chooses between the engines with sparse P.
+
+    **kwargs
+        Additional keyword arguments for estimate_memory.
+
+    Returns
+    -------
+    engine : str
+        The chosen engine.
+
+    Raises
+    ------
+    MemoryError
+        If the chosen engine, or every engine with engine='auto', needs more memory than the budget.
+    """
+    if memory_limit is None:
+        memory_limit = _available_memory()
+    if engine=="auto":
+        candidates = (["exact"] if allow_exact else []) + (["fft", "sparse"] if n_dimensions<=3 else ["sparse"])
+    else:
+        candidates = [engine]
+    estimates = {e: estimate_memory(n_samples, n_dimensions, e, **kwargs) for e in candidates}
+    for e in candidates:
+        if memory_limit is None or estimates[e]<=memory_limit:
+            return e
+    raise MemoryError("Fitting {} samples needs more memory than the limit of {}: {}".format(
+        n_samples, _format_bytes(memory_limit), ", ".join("{} engine {}".format(e, _format_bytes(m)) for e, m in estimates.items())))
+
+def _available_memory() -> int|None:
+    # MemAvailable incluye la cache que el sistema puede liberar; SC_AVPHYS_PAGES no
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE")*os.sysconf("SC_AVPHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def _format_bytes(n) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n<1024:
+            return "{:.1f} {}".format(n, unit)
+        n /= 1024
+    return "{:.1f} TB".format(n)
@@ -0,0 +1,120 @@
+import json
+import numpy as np
+from collections.abc import Mapping
+
+# Campos de cada iteracion; NaN cuando el valor no se calcula en esa iteracion
+FIELDS = np.dtype([
+    ("iteration", np.int64),
+    ("cost", np.float64),
+    ("grad_norm", np.float64),
+    ("step_size", np.float64),
+    ("spread", np.float64),
+    ("time", np.float64),
+])
+
+class History():
+    """Structured record of the metrics of the iterations of a descent.
+
+    The rows are kept in a NumPy structured array with the fields of FIELDS, which grows by doubling its capacity.
+    Optionally, every row is also appended to a JSONL file, one JSON object per line, in buffered writes.
+
+    Parameters
+    ----------
+    records : None or structured ndarray with the fields of FIELDS, default=None
+        Rows recorded before, like the records of another History. They are not written to path.
+
+    path : str or None, default=None
+        The JSONL file the new rows are appended to. If None, they are only kept in memory.
+
+    buffer_size : int, default=100
+        Number of rows written to path at the same time.
+    """
+    def __init__(self, records=None, *, path:str=None, buffer_size=100):
+        records = np.empty(0, dtype=FIELDS) if records is None else np.asarray(records, dtype=FIELDS)
+        self._data = np.empty(max(64, 2*len(records)), dtype=FIELDS)
+        self._data[:len(records)] = records
+        self._size = len(records)
+        self._path = path
+        self._buffer = []
+        self._buffer_size = buffer_size
+
+    @property
+    def records(self) -> np.ndarray:
+        """The rows recorded so far, as a view of the structured array. It is not valid after the next append.
+        """
+        return self._data[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, iteration:int, *, cost=np.nan, grad_norm=np.nan, step_size=np.nan, spread=np.nan, time=np.nan):
+        """Record the metrics of one iteration. The ones not given are stored as NaN.
+        """
+        if self._size==len(self._data):
+            data = np.empty(2*len(self._data), dtype=FIELDS)
+            data[:self._size] = self._data
+            self._data = data
+        row = (iteration, cost, grad_norm, step_size, spread, time)
+        self._data[self._size] = row
+        self._size += 1
+        if self._path is not None:
+            # JSON no admite NaN: los valores no calculados se escriben como null
+            values = [int(iteration)] + [None if np.isnan(v) else float(v) for v in row[1:]]
+            self._buffer.append(json.dumps(dict(zip(FIELDS.names, values))))
+            if len(self._buffer)>=self._buffer_size:
+                self.flush()
+
+    def extend(self, records):
+        """Record several rows, like the records of another History.
+        """
+        for row in np.asarray(records, dtype=FIELDS).tolist():
+            self.append(row[0], **dict(zip(FIELDS.names[1:], row[1:])))
+
+    def flush(self):
+        """Write the buffered rows to the JSONL file.
+        """
+        if self._path is not None and len(self._buffer)>0:
+            with open(self._path, "a") as f:
+                f.write("\n".join(self._buffer)+"\n")
+            self._buffer.clear()
+
+    def costs(self) -> "CostRecord":
+        """Returns a read-only dict-like view {iteration: cost} of the rows where the cost was computed.
+        """
+        return CostRecord(self)
+
+class CostRecord(Mapping):
+    """Read-only dict-like view {iteration: cost} of a History, for the rows where the cost was computed.
+
+    It reflects the rows appended to the History after it was created. If an iteration was recorded
+    more than once, its last cost is used.
+    """
+    def __init__(self, history:History):
+        self._history = history
+        self._dict = {}
+        self._size = 0
+
+    def _as_dict(self) -> dict:
+        # La History solo crece: el dict se actualiza con las filas nuevas desde la ultima consulta
+        if len(self._history)!=self._size:
+            rows = self._history.records[self._size:]
+            rows = rows[~np.isnan(rows["cost"])]
+            self._dict.update(zip(rows["iteration"].tolist(), rows["cost"].tolist()))
+            self._size = len(self._history)
+        return self._dict
+
+    def __getitem__(self, iteration):
+        return self._as_dict()[iteration]
+
+    def __iter__(self):
+        return iter(self._as_dict())
+
+    def __len__(self) -> int:
+        return len(self._as_dict())
+
+    def __repr__(self) -> str:
+        return "CostRecord({})".format(self._as_dict())
+
+    def __reduce__(self):
+        # Al enviarse a otro proceso se convierte en un dict normal
+        return dict, (self._as_dict(),)
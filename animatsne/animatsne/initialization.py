@@ -0,0 +1,110 @@
+import numpy as np
+#===PCA====================================================================
+def pca(X, n_components:int, *, seed:int=None, n_oversamples=10, n_power_iter=4) -> np.ndarray:
+    """Project the input onto its first principal components using a randomized SVD.
+
+    Parameters
+    ----------
+    X : array-like of shape (n_samples, n_features)
+        The data to project. It is centered implicitly, so no centered copy of it is made.
+
+    n_components : int
+        The number of principal components to keep.
+
+    seed : int, default=None
+        Seed for the random projection, so that the result is reproducible.
+
+    n_oversamples : int, default=10
+        Additional random vectors sampled to improve the approximation of the range of `X`.
+
+    n_power_iter : int, default=4
+        Number of power iterations used to sharpen the decay of the singular values.
+
+    Returns
+    -------
+    projection : ndarray of shape (n_samples, n_components)
+        The scores of the samples on the principal components.
+    """
+    X = np.asarray(X)
+    if not np.issubdtype(X.dtype, np.floating):
+        X = X.astype(np.float64)
+    rng = np.random.default_rng(seed)
+    mean = X.mean(axis=0)
+    n_random = min(n_components + n_oversamples, *X.shape)
+
+    # Rango aproximado de X centrada: (X - 1*mean) @ omega = X@omega - mean@omega
+    omega = rng.standard_normal(size=(X.shape[1], n_random))
+    basis = X @ omega - mean @ omega
+    for _ in range(n_power_iter):
+        basis, _ = np.linalg.qr(basis)
+        basis_t = X.T @ basis - np.outer(mean, basis.sum(axis=0))
+        basis_t, _ = np.linalg.qr(basis_t)
+        basis = X @ basis_t - mean @ basis_t
+    basis, _ = np.linalg.qr(basis)
+
+    # SVD de la proyeccion pequeña (n_random, n_features)
+    small = basis.T @ X - np.outer(basis.sum(axis=0), mean)
+    u_small, s, _ = np.linalg.svd(small, full_matrices=False)
+    u = basis @ u_small[:, :n_components]
+
+    # Signo determinista: la entrada de mayor valor absoluto de cada componente es positiva
+    signs = np.sign(u[np.argmax(np.abs(u), axis=0), range(n_components)])
+    signs[signs==0] = 1.
+    return u * (s[:n_components] * signs)
+
+#===Spectral===============================================================
+def spectral(P, n_components:int, *, seed:int=None, tol=1e-4, max_iter=None) -> np.ndarray:
+    """Obtain a Laplacian eigenmap of the affinity graph given by the joint probabilities.
+
+    Parameters
+    ----------
+    P : ndarray or sparse matrix of shape (n_samples, n_samples), or condensed ndarray
+        The symmetric joint probabilities between the samples.
+
+    n_components : int
+        The number of dimensions of the eigenmap.
+
+    seed : int, default=None
+        Seed for the starting vector of the eigensolver, so that the result is reproducible.
+
+    tol : float, default=1e-4
+        Tolerance for the eigenvalues.
+
+    max_iter : int, default=None
+        Maximum number of iterations of the eigensolver.
+        If None, the default of scipy.sparse.linalg.eigsh is used.
+
+    Returns
+    -------
+    eigenmap : ndarray of shape (n_samples, n_components)
+        The leading nontrivial eigenvectors of the random walk on the affinity graph.
+    """
+    from scipy import sparse
+    from scipy.sparse import linalg
+    from scipy.spatial import distance
+
+    if not sparse.issparse(P) and np.ndim(P)==1:
+        P = distance.squareform(P, checks=False)
+    P = sparse.csr_matrix(P)
+    n = P.shape[0]
+    rng = np.random.default_rng(seed)
+    deg = np.asarray(P.sum(axis=1)).ravel()
+    deg_inv_sqrt = 1/np.sqrt(np.maximum(deg, np.finfo(float).tiny))
+
+    # Autovectores mayores de D^-1/2 P D^-1/2 = menores del laplaciano normalizado
+    normalized = sparse.diags(deg_inv_sqrt) @ P @ sparse.diags(deg_inv_sqrt)
+    k = n_components+1
+    try:
+        eigvals, eigvecs = linalg.eigsh(normalized, k=k, which="LA", tol=tol, maxiter=max_iter, v0=rng.uniform(size=n))
+    except linalg.ArpackNoConvergence:
+        eigvecs = rng.standard_normal(size=(n, k))
+        eigvecs[:, 0] = np.sqrt(deg)
+        eigvals, eigvecs = linalg.lobpcg(normalized, eigvecs, largest=True, tol=tol, maxiter=max_iter or 200)
+    
+    # El autovector de mayor autovalor es el trivial (proporcional a sqrt(D))
+    order = np.argsort(eigvals)[::-1]
+    result = eigvecs[:, order[1:]] * deg_inv_sqrt[:, None]
+
+    signs = np.sign(result[np.argmax(np.abs(result), axis=0), range(n_components)])
+    signs[signs==0] = 1.
+    return result * signs
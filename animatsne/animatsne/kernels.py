@@ -0,0 +1,387 @@
+import numpy as np
+from functools import wraps
+from . import similarities
+try:
+    import numba
+    from numba import prange
+except ImportError:
+    numba = None
+
+def available() -> bool:
+    """Returns True if numba is installed, so the compiled kernels of this module can be used.
+    """
+    return numba is not None
+
+def launched() -> bool:
+    """Returns True if a parallel kernel of this module has run in this process.
+
+    The first one starts the pool of threads of numba, which does not survive a fork of the process,
+    so the processes started afterwards must not be forked.
+    """
+    return _launched
+
+_launched = False
+
+def _jit(function):
+    # Sin numba el modulo se importa igualmente, pero sus kernels no se pueden llamar
+    if numba is None:
+        return function
+    kernel = numba.njit(parallel=True, cache=True)(function)
+    @wraps(function)
+    def launch(*args):
+        global _launched
+        _launched = True
+        return kernel(*args)
+    return launch
+
+def _jit_serial(function):
+    # Funciones auxiliares llamadas desde dentro de los kernels
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+@_jit_serial
+def _pair_index(offsets, i, j):
+    # Posicion del par (i, j) en la forma condensada. Los indices de prange no tienen signo: se pasan a int64
+    low, high = np.int64(min(i, j)), np.int64(max(i, j))
+    return offsets[low]+high-low-1
+
+#===Joint Probabilities (Gaussian)=========================================
+def joint_probabilities_gaussian(dists:np.ndarray, perplexity:float, tolerance:float=0., search_iters=10000) -> tuple[np.ndarray, np.ndarray]:
+    """Compiled version of similarities.joint_probabilities_gaussian, with return_betas=True.
+
+    The deviation of every row is searched in parallel, without allocating a row of the
+    distances per step of the search. The search stops after search_iters steps even if tolerance>0.
+    If dists is condensed, so is the result.
+    """
+    dists = np.ascontiguousarray(dists)
+    dtype = np.float32 if dists.dtype==np.float32 else np.float64
+    if dists.ndim==1:
+        n = similarities.n_samples_of(dists)
+        # Cada par recibe la probabilidad condicionada de sus dos filas, en arrays separados para no pisarse
+        upper = np.zeros_like(dists, dtype=dtype)
+        lower = np.zeros_like(dists, dtype=dtype)
+        deviations = _search_gaussian_condensed(dists, similarities.condensed_offsets(n), float(perplexity), abs(float(tolerance)), int(search_iters), upper, lower)
+        upper += lower
+        del lower
+        upper /= 2*n
+        return upper, 1/(2*np.square(deviations))
+    cond_probs = np.zeros_like(dists, dtype=dtype)
+    deviations = _search_gaussian(dists, float(perplexity), abs(float(tolerance)), int(search_iters), cond_probs)
+    n = dists.shape[0]
+    return (cond_probs+cond_probs.T)/(2*n), 1/(2*np.square(deviations))
+
+@_jit
+def _search_gaussian(dists, perplexity, tolerance, iters, cond_probs):
+    n = dists.shape[0]
+    deviations = np.empty(n)
+    for i in prange(n):
+        row = np.zeros(n)
+        deviations[i] = _search_row(dists[i], i, perplexity, tolerance, iters, row)
+        for j in range(n):
+            cond_probs[i, j] = row[j]
+    return deviations
+
+@_jit
+def _search_gaussian_condensed(dists, offsets, perplexity, tolerance, iters, upper, lower):
+    n = len(offsets)
+    deviations = np.empty(n)
+    for i in prange(n):
+        dist_row = np.zeros(n)
+        for j in range(n):
+            if j!=i:
+                dist_row[j] = dists[_pair_index(offsets, i, j)]
+        row = np.zeros(n)
+        deviations[i] = _search_row(dist_row, i, perplexity, tolerance, iters, row)
+        for j in range(i):
+            lower[_pair_index(offsets, i, j)] = row[j]
+        for j in range(i+1, n):
+            upper[_pair_index(offsets, i, j)] = row[j]
+    return deviations
+
+@_jit_serial
+def _search_row(dists, i, perplexity, tolerance, iters, row):
+    # Deja en row las probabilidades condicionadas de la fila i y devuelve su desviacion
+    n = len(dists)
+    low, high = 1e-20, 1e5
+    deviation = (low+high)/2
+    total = 0.
+    for step in range(iters+1):
+        deviation = (low+high)/2
+        factor = 1/(2*deviation*deviation)
+        total = 0.
+        for j in range(n):
+            row[j] = 0. if j==i else np.exp(-dists[j]*factor)
+            total += row[j]
+        if total>0.:
+            entropy = 0.
+            for j in range(n):
+                if row[j]>0.:
+                    p = row[j]/total
+                    entropy -= p*np.log2(p)
+            diff = 2.**entropy - perplexity
+            if abs(diff)<=tolerance:
+                break
+        else:
+            # Todas las probabilidades se anulan: la gaussiana es demasiado estrecha
+            diff = -1.
+        if step==iters:
+            break
+        if diff>0.:
+            high = deviation
+        else:
+            low = deviation
+    for j in range(n):
+        row[j] = row[j]/total if total>0. else 0.
+    return deviation
+
+#===Conditional Probabilities (Nearest Neighbors)==========================
+def conditional_probabilities_knn(dists:np.ndarray, perplexity:float, tolerance:float=0., search_iters=200, *, betas=None) -> tuple[np.ndarray, np.ndarray]:
+    """Compiled version of similarities.conditional_probabilities_knn, searching the precision of every point in parallel.
+    """
+    dists = np.ascontiguousarray(dists, dtype=np.float64)
+    dists = dists - dists.min(axis=1, keepdims=True)
+    if betas is None:
+        betas = 1/np.maximum(np.median(dists, axis=1), np.finfo(float).tiny)
+    betas = np.array(betas, dtype=np.float64)
+    p = np.empty_like(dists)
+    _search_knn(dists, float(perplexity), abs(float(tolerance)), int(search_iters), betas, p)
+    return p, betas
+
+@_jit
+def _search_knn(dists, perplexity, tolerance, iters, betas, p):
+    n, k = dists.shape
+    for i in prange(n):
+        beta = betas[i]
+        beta_min, beta_max = 0., np.inf
+        for _ in range(iters):
+            total = 0.
+            for j in range(k):
+                p[i, j] = np.exp(-dists[i, j]*beta)
+                total += p[i, j]
+            entropy = 0.
+            for j in range(k):
+                if p[i, j]>0.:
+                    q = p[i, j]/total
+                    entropy -= q*np.log2(q)
+            diff = 2.**entropy - perplexity
+            if abs(diff)<=tolerance:
+                break
+            # Perplejidad demasiado alta: gaussiana demasiado ancha, aumentar beta
+            if diff>0.:
+                beta_min = beta
+            else:
+                beta_max = beta
+            beta = beta*2 if np.isinf(beta_max) else (beta_min+beta_max)/2
+        total = 0.
+        for j in range(k):
+            p[i, j] = np.exp(-dists[i, j]*beta)
+            total += p[i, j]
+        for j in range(k):
+            p[i, j] /= total
+        betas[i] = beta
+
+#===Exact gradient=========================================================
+def gradient_exact(P:np.ndarray, y:np.ndarray) -> tuple[np.ndarray, float]:
+    """Compute the gradient of the cost function for a dense P without storing Q.
+
+    Each row of the gradient is reduced in a single fused loop over the other samples,
+    so no array of shape (n_samples, n_samples) is allocated. If P is condensed, each pair
+    is visited once and its forces added to both samples, in a buffer per thread.
+
+    Parameters
+    ----------
+    P : ndarray of shape (n_samples, n_samples) or (n_samples*(n_samples-1)/2,)
+        The joint probabilities in the original space, square or condensed.
+
+    y : ndarray of shape (n_samples, n_dimensions)
+        The current embedding.
+
+    Returns
+    -------
+    gradient : ndarray of shape (n_samples, n_dimensions)
+        The gradient of the cost function.
+
+    z : float
+        The normalization of Q, that is, the sum of (1+d_ij)^-1 for every pair of points i!=j.
+    """
+    y = np.ascontiguousarray(y)
+    if P.ndim==1:
+        n_threads = numba.get_num_threads()
+        attraction = np.zeros((n_threads,)+y.shape)
+        repulsion = np.zeros((n_threads,)+y.shape)
+        z = _gradient_exact_condensed(np.ascontiguousarray(P), similarities.condensed_offsets(len(y)), y, attraction, repulsion)
+        return (4*(attraction.sum(axis=0) - repulsion.sum(axis=0)/z)).astype(y.dtype, copy=False), z
+    z = _normalization_exact(y)
+    grad = np.empty_like(y)
+    _gradient_exact(np.ascontiguousarray(P), y, z, grad)
+    return grad, z
+
+def kl_divergence_exact(P:np.ndarray, y:np.ndarray, z:float) -> float:
+    """Compute the Kullback-Leibler divergence for a dense P without storing Q.
+
+    Parameters
+    ----------
+    P : ndarray of shape (n_samples, n_samples) or (n_samples*(n_samples-1)/2,)
+        The joint probabilities in the original space, square or condensed.
+
+    y : ndarray of shape (n_samples, n_dimensions)
+        The current embedding.
+
+    z : float
+        The normalization of Q, as returned by gradient_exact.
+
+    Returns
+    -------
+    divergence : double.
+        The divergence.
+    """
+    if P.ndim==1:
+        return _kl_divergence_exact_condensed(np.ascontiguousarray(P), similarities.condensed_offsets(len(y)), np.ascontiguousarray(y), z)
+    return _kl_divergence_exact(np.ascontiguousarray(P), np.ascontiguousarray(y), z)
+
+@_jit
+def _normalization_exact(y):
+    n, d = y.shape
+    z = 0.
+    for i in prange(n):
+        row = 0.
+        for j in range(n):
+            if j!=i:
+                dist = 0.
+                for k in range(d):
+                    diff = y[i, k]-y[j, k]
+                    dist += diff*diff
+                row += 1/(1+dist)
+        z += row
+    return z
+
+@_jit
+def _gradient_exact(P, y, z, grad):
+    n, d = y.shape
+    for i in prange(n):
+        acc = np.zeros(d)
+        for j in range(n):
+            if j!=i:
+                dist = 0.
+                for k in range(d):
+                    diff = y[i, k]-y[j, k]
+                    dist += diff*diff
+                w = 1/(1+dist)
+                c = (P[i, j] - w/z)*w
+                for k in range(d):
+                    acc[k] += c*(y[i, k]-y[j, k])
+        for k in range(d):
+            grad[i, k] = 4*acc[k]
+
+@_jit
+def _kl_divergence_exact(P, y, z):
+    n, d = y.shape
+    result = 0.
+    for i in prange(n):
+        row = 0.
+        for j in range(n):
+            if j!=i and P[i, j]!=0.:
+                dist = 0.
+                for k in range(d):
+                    diff = y[i, k]-y[j, k]
+                    dist += diff*diff
+                row += P[i, j]*np.log(P[i, j]*z*(1+dist))
+        result += row
+    return result
+
+@_jit
+def _gradient_exact_condensed(P, offsets, y, attraction, repulsion):
+    # Cada par (i, j) con j>i se visita una vez: su fuerza se suma a i y se resta a j.
+    # Cada hilo t acumula en su propio buffer las filas t, t+n_threads, ..., que reparten los pares por igual
+    n, d = y.shape
+    n_threads = attraction.shape[0]
+    z_threads = np.zeros(n_threads)
+    for t in prange(n_threads):
+        z_thread = 0.
+        # Los indices de prange no tienen signo: se pasan a int64
+        for i in range(np.int64(t), n, n_threads):
+            for j in range(i+1, n):
+                dist = 0.
+                for k in range(d):
+                    diff = y[i, k]-y[j, k]
+                    dist += diff*diff
+                w = 1/(1+dist)
+                z_thread += w
+                a = P[offsets[i]+j-i-1]*w
+                r = w*w
+                for k in range(d):
+                    diff = y[i, k]-y[j, k]
+                    attraction[t, i, k] += a*diff
+                    attraction[t, j, k] -= a*diff
+                    repulsion[t, i, k] += r*diff
+                    repulsion[t, j, k] -= r*diff
+        z_threads[t] = z_thread
+    return 2*z_threads.sum()
+
+@_jit
+def _kl_divergence_exact_condensed(P, offsets, y, z):
+    # Cada par aparece una vez, pero cuenta en las dos mitades de P
+    n, d = y.shape
+    result = 0.
+    for i in prange(n):
+        row = 0.
+        for j in range(i+1, n):
+            p = P[offsets[i]+j-i-1]
+            if p!=0.:
+                dist = 0.
+                for k in range(d):
+                    diff = y[i, k]-y[j, k]
+                    dist += diff*diff
+                row += p*np.log(p*z*(1+dist))
+        result += row
+    return 2*result
+
+#===Sparse P===============================================================
+def gradient_sparse(P, y:np.ndarray) -> tuple[np.ndarray, float]:
+    """Compiled version of engines.gradient_sparse.
+
+    The attractive forces of each row are reduced over its nonzero entries of P, and
+    the repulsive forces over every other sample, in the same parallel loop.
+    """
+    P = P.tocsr()
+    y = np.ascontiguousarray(y)
+    attraction = np.empty_like(y)
+    repulsion = np.empty_like(y)
+    z_rows = np.empty(len(y))
+    _forces_sparse(P.indptr, P.indices, P.data, y, attraction, repulsion, z_rows)
+    z = float(z_rows.sum())
+    return 4*(attraction - repulsion/y.dtype.type(z)), z
+
+@_jit
+def _forces_sparse(indptr, indices, data, y, attraction, repulsion, z_rows):
+    n, d = y.shape
+    for i in prange(n):
+        acc = np.zeros(d)
+        for idx in range(indptr[i], indptr[i+1]):
+            j = indices[idx]
+            dist = 0.
+            for k in range(d):
+                diff = y[i, k]-y[j, k]
+                dist += diff*diff
+            c = data[idx]/(1+dist)
+            for k in range(d):
+                acc[k] += c*(y[i, k]-y[j, k])
+        for k in range(d):
+            attraction[i, k] = acc[k]
+
+        acc[:] = 0.
+        row = 0.
+        for j in range(n):
+            if j!=i:
+                dist = 0.
+                for k in range(d):
+                    diff = y[i, k]-y[j, k]
+                    dist += diff*diff
+                w = 1/(1+dist)
+                row += w
+                for k in range(d):
+                    acc[k] += w*w*(y[i, k]-y[j, k])
+        for k in range(d):
+            repulsion[i, k] = acc[k]
+        z_rows[i] = row
@@ -0,0 +1,142 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from . import similarities
+
+def trustworthiness(X, embed, n_neighbors=5, **kwargs) -> float:
+    """Measure how much the neighbors of each sample in the embedding are also its neighbors in the input.
+
+    It is 1 minus the mean penalty of the samples that are among the n_neighbors nearest of another
+    in the embedding but not in the input, weighted by their rank in the input, as in
+    Venna and Kaski (2001). It is the same measure as sklearn.manifold.trustworthiness.
+
+    Parameters
+    ----------
+    X : array-like of shape (n_samples, n_features)
+        The input data. It is read by blocks, so it can be a memory-mapped file.
+
+    embed : array-like of shape (n_samples, n_dimensions)
+        The embedding of the input data.
+
+    n_neighbors : int, default=5
+        The number of neighbors considered. Must be lower than n_samples/2.
+
+    **kwargs
+        Additional keyword arguments for evaluate: block_size, n_jobs and dtype.
+
+    Returns
+    -------
+    trustworthiness : float
+        A value between 0 and 1, where 1 means that the neighbors are preserved.
+    """
+    return evaluate(X, embed, n_neighbors, **kwargs)["trustworthiness"]
+
+def continuity(X, embed, n_neighbors=5, **kwargs) -> float:
+    """Measure how much the neighbors of each sample in the input are also its neighbors in the embedding.
+
+    The counterpart of trustworthiness, with the roles of the input and the embedding swapped.
+    Same parameters as trustworthiness.
+    """
+    return evaluate(X, embed, n_neighbors, **kwargs)["continuity"]
+
+def knn_recall(X, embed, n_neighbors=5, **kwargs) -> float:
+    """Fraction of the n_neighbors nearest neighbors of each sample in the input that are also among
+    its n_neighbors nearest in the embedding, averaged over the samples.
+
+    Same parameters as trustworthiness.
+    """
+    return evaluate(X, embed, n_neighbors, **kwargs)["knn_recall"]
+
+def evaluate(X, embed, n_neighbors=5, *, block_size=None, n_jobs=None, dtype=None) -> dict:
+    """Compute trustworthiness, continuity and kNN recall in a single pass over the samples.
+
+    The distances are computed by blocks of rows, in parallel threads, and the neighbors of each row found
+    with a partial sort, so the memory used does not grow with the square of the number of samples.
+    The rank of a neighbor is the number of samples strictly closer to the sample plus 1, so it can differ
+    from that of scikit-learn when there are ties in the distances.
+
+    Parameters
+    ----------
+    X : array-like of shape (n_samples, n_features)
+        The input data. It is read by blocks, so it can be a memory-mapped file.
+
+    embed : array-like of shape (n_samples, n_dimensions)
+        The embedding of the input data.
+
+    n_neighbors : int, default=5
+        The number of neighbors considered. Must be lower than n_samples/2.
+
+    block_size : int or None, default=None
+        Number of rows whose distances to every sample are kept in memory at the same time by each thread.
+        If None, about 2^22 distances per block.
+
+    n_jobs : int or None, default=None
+        Number of threads. If None, the number of processors of the machine.
+
+    dtype : None or data-type, default=None
+        If np.float32, the distances of the input are computed in single precision.
+        Otherwise, in double precision.
+
+    Returns
+    -------
+    scores : dict
+        With the keys 'trustworthiness', 'continuity' and 'knn_recall'.
+    """
+    embed = np.asarray(embed)
+    n, k = len(X), n_neighbors
+    assert len(embed)==n, "X and embed must have the same number of samples"
+    assert 1<=k<n/2, "n_neighbors must satisfy 1<=n_neighbors<n_samples/2"
+    block_size = max(1, 2**22//n) if block_size is None else block_size
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() if n_jobs is None else n_jobs) as pool:
+        blocks = pool.map(lambda start: _evaluate_rows(X, embed, k, start, min(start+block_size, n), dtype), range(0, n, block_size))
+        trust, cont, shared = np.sum(list(blocks), axis=0)
+    # Normalizacion de Venna y Kaski: la penalizacion maxima posible
+    norm = 2/(n*k*(2*n-3*k-1))
+    return {"trustworthiness": 1-norm*trust, "continuity": 1-norm*cont, "knn_recall": shared/(n*k)}
+
+def _evaluate_rows(X, embed, k, start, stop, dtype) -> tuple[float, float, int]:
+    dists_x = _distances_rows(X, start, stop, dtype)
+    dists_y = _distances_rows(embed, start, stop, None)
+    neighbors_x = np.argpartition(dists_x, k-1, axis=1)[:, :k]
+    neighbors_y = np.argpartition(dists_y, k-1, axis=1)[:, :k]
+    # Vecinos en un espacio que tambien lo son en el otro
+    in_x = (neighbors_y[:, :, np.newaxis]==neighbors_x[:, np.newaxis, :]).any(axis=2)
+    in_y = (neighbors_x[:, :, np.newaxis]==neighbors_y[:, np.newaxis, :]).any(axis=2)
+    trust = _rank_penalty(dists_x, neighbors_y, ~in_x, k)
+    cont = _rank_penalty(dists_y, neighbors_x, ~in_y, k)
+    return trust, cont, np.count_nonzero(in_y)
+
+def _distances_rows(X, start, stop, dtype) -> np.ndarray:
+    # Distancias (al cuadrado) de las filas start:stop a todas las muestras, por bloques de columnas,
+    # convirtiendo a coma flotante solo un bloque de X cada vez. La propia muestra queda a distancia infinita
+    n = len(X)
+    rows = np.asarray(X[start:stop], dtype=np.float32 if dtype is not None and np.dtype(dtype)==np.float32 else np.float64)
+    result = np.empty((stop-start, n))
+    col_size = max(stop-start, 1024)
+    for col_start in range(0, n, col_size):
+        col_stop = min(col_start+col_size, n)
+        result[:, col_start:col_stop] = similarities.pairwise_euclidean_distance_to(rows, np.asarray(X[col_start:col_stop], dtype=rows.dtype), dtype=dtype)
+    result[np.arange(stop-start), np.arange(start, stop)] = np.inf
+    return result
+
+def _rank_penalty(dists, neighbors, missing, k) -> float:
+    # Suma de rango-k de los vecinos marcados en missing, con el rango segun dists:
+    # el numero de muestras mas cercanas que el vecino, mas 1
+    if not missing.any():
+        return 0.
+    threshold = np.take_along_axis(dists, neighbors, axis=1)
+    closer = np.empty(dists.shape, dtype=bool)
+    penalty = 0.
+    for c in range(k):
+        rows = np.flatnonzero(missing[:, c])
+        if len(rows)==0:
+            continue
+        if len(rows)<len(dists)//4:
+            ranks = np.count_nonzero(dists[rows]<threshold[rows, c, np.newaxis], axis=1)+1
+        else:
+            # Muchas filas: se comparan todas sin copiar dists
+            np.less(dists, threshold[:, c, np.newaxis], out=closer)
+            ranks = np.count_nonzero(closer, axis=1)[rows]+1
+        penalty += np.sum(ranks-k)
+    return float(penalty)
@@ -0,0 +1,97 @@
+import time
+from contextlib import contextmanager
+
+class PhaseTimer():
+    """Cumulative wall time and number of calls of each phase of a process.
+
+    Attributes
+    ----------
+    phases : dict
+        For each phase, in the order they were first run, a dict with the keys
+        'seconds' (total wall time) and 'calls' (number of times it was run).
+    """
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name:str):
+        """Time the code run inside the context as one call of the given phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter()-start)
+
+    def add(self, name:str, seconds:float, calls:int=1):
+        """Add the given time and number of calls to a phase.
+        """
+        phase = self.phases.setdefault(name, {"seconds": 0., "calls": 0})
+        phase["seconds"] += seconds
+        phase["calls"] += calls
+
+    def total(self) -> float:
+        """Returns the wall time of every phase together.
+        """
+        return sum(phase["seconds"] for phase in self.phases.values())
+
+    def reset(self):
+        """Forget every phase. The dict phases is emptied, not replaced.
+        """
+        self.phases.clear()
+
+@contextmanager
+def profile(path:str=None, *, memory=True, n_frames=1):
+    """Profile the code run inside the context with cProfile and, optionally, tracemalloc.
+
+    Intended to be used around a call to fit, to see which functions take the time and where memory is allocated:
+
+        with profiling.profile("fit") as result:
+            model.fit(X)
+        result["stats"].sort_stats("cumulative").print_stats(20)
+
+    Parameters
+    ----------
+    path : str or None, default=None
+        If not None, the prefix of the files the results are dumped to: path+'.prof',
+        readable with pstats or snakeviz, and path+'.tracemalloc', readable with tracemalloc.Snapshot.load.
+
+    memory : bool, default=True
+        If True, memory allocations are traced too. It makes the code inside the context noticeably slower.
+
+    n_frames : int, default=1
+        Number of frames of the traceback stored by tracemalloc for each allocation.
+
+    Yields
+    ------
+    result : dict
+        Filled when the context exits, with the keys 'stats' (pstats.Stats), 'snapshot'
+        (tracemalloc.Snapshot or None) and 'peak_memory' (peak traced memory in bytes, or None).
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    result = {"stats": None, "snapshot": None, "peak_memory": None}
+    # Si tracemalloc ya estaba activo (por ejemplo, con -X tracemalloc) no se detiene al salir
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(n_frames)
+    elif memory:
+        tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        result["stats"] = pstats.Stats(profiler)
+        if memory:
+            result["snapshot"] = tracemalloc.take_snapshot()
+            result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            if started:
+                tracemalloc.stop()
+        if path is not None:
+            result["stats"].dump_stats(path+".prof")
+            if result["snapshot"] is not None:
+                result["snapshot"].dump(path+".tracemalloc")
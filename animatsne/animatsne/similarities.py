@@ -1,6 +1,6 @@
 import numpy as np
 #===Euclidean Distance=====================================================
-def pairwise_euclidean_distance(X, *, sqrt=False, condensed=False) -> np.ndarray:
+def pairwise_euclidean_distance(X, *, sqrt=False, condensed=False, dtype=None) -> np.ndarray:
     """Compute the euclidean distances between the vectors of the given input.
     Parameters
     ----------
@@ -15,26 +15,85 @@ def pairwise_euclidean_distance(X, *, sqrt=False, condensed=False) -> np.ndarray
         If True, returns the condensed form of the array.
         Returns square form otherwise.
     
+    dtype : None or data-type, default=None
+        If np.float32, the distances are computed and returned in single precision.
+        Otherwise, in double precision.
+    
     Returns
     -------
     distances : ndarray of shape (n_samples_X, n_samples_X)
         Returns the distances between the row vectors of `X`.
     """
     from scipy.spatial import distance
+    if dtype is not None and np.dtype(dtype)==np.float32:
+        result = _squared_distances_gemm(X, X)
+        np.fill_diagonal(result, 0.)
+        if sqrt:
+            np.sqrt(result, out=result)
+        return distance.squareform(result, checks=False) if condensed else result
     metrica = "euclidean" if sqrt else "sqeuclidean"
     result = distance.pdist(X, metric=metrica)
     if not condensed:
         result = distance.squareform(result)
     return result
 
+def pairwise_euclidean_distance_to(X, Y, *, dtype=None) -> np.ndarray:
+    """Compute the squared euclidean distances from each vector of X to each vector of Y.
+    Parameters
+    ----------
+    X : array-like of shape (n_samples_X, n_features)
+        An array where each row is a sample and each column is a feature.
+    
+    Y : array-like of shape (n_samples_Y, n_features)
+        An array where each row is a sample and each column is a feature.
+    
+    dtype : None or data-type, default=None
+        If np.float32, the distances are computed and returned in single precision.
+        Otherwise, in double precision.
+    
+    Returns
+    -------
+    distances : ndarray of shape (n_samples_X, n_samples_Y)
+        Returns the squared distances between the row vectors of `X` and those of `Y`.
+    """
+    from scipy.spatial import distance
+    if dtype is not None and np.dtype(dtype)==np.float32:
+        return _squared_distances_gemm(X, Y)
+    if np.shape(X)[1]>3:
+        # cdist no usa BLAS: con muchas columnas el producto matricial es mucho mas rapido
+        return _squared_distances_gemm(X, Y, dtype=np.float64)
+    return distance.cdist(X, Y, metric="sqeuclidean")
+
+def _squared_distances_gemm(X, Y, *, dtype=np.float32) -> np.ndarray:
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    if X.shape[1]<=3:
+        # Pocas columnas (embeddings): diferencias directas, sin cancelacion
+        result = np.zeros((len(X), len(Y)), dtype=dtype)
+        for x, y in zip(X.T.astype(dtype), Y.T.astype(dtype)):
+            diff = np.subtract.outer(x, y)
+            result += np.square(diff, out=diff)
+        return result
+    # Muchas columnas: |x|^2 + |y|^2 - 2<x,y> sobre datos centrados, con el producto en dtype (sgemm o dgemm)
+    mean = Y.mean(axis=0, dtype=np.float64)
+    X = (X-mean).astype(dtype)
+    Y = (Y-mean).astype(dtype)
+    result = X @ Y.T
+    result *= -2
+    result += np.einsum("ij,ij->i", X, X)[:, None]
+    result += np.einsum("ij,ij->i", Y, Y)[None, :]
+    return np.maximum(result, 0., out=result)
+
 #===Joint Probabilities (Gaussian))========================================
-def joint_probabilities_gaussian(dists:np.ndarray, perplexity:int, tolerance:float=0., search_iters=10000) -> np.ndarray:
+def joint_probabilities_gaussian(dists:np.ndarray, perplexity:int, tolerance:float=0., search_iters=10000, *, return_betas=False, backend="numpy") -> np.ndarray|tuple[np.ndarray, np.ndarray]:
     """Obtain the joint probabilities (or affinities) of the points with the given distances.
 
     Parameters
     ----------
-    distances : ndarray of shape (n_samples, n_samples)
+    distances : ndarray of shape (n_samples, n_samples) or (n_samples*(n_samples-1)/2,)
         An array with the distances between the different points. The distances must be calculated without performing the square root
+        If condensed, like the output of pairwise_euclidean_distance with condensed=True,
+        the probabilities are returned condensed too, and no square array is allocated.
 
     perplexity : float, default = 10.0
         Goal perplexity value.
@@ -45,17 +104,71 @@ def joint_probabilities_gaussian(dists:np.ndarray, perplexity:int, tolerance:flo
     
     search_iters : int, default = 10000
         Number of iterations of search for the value of each sigma
+    
+    return_betas : bool, default = False
+        If True, the precision of the gaussian of each point, beta=1/(2*sigma^2), is also returned.
+    
+    backend : str, default = 'numpy'
+        If 'numba', the compiled kernel of animatsne.kernels is used.
 
     Returns
     -------
     probabilities : ndarray of shape (n_samples, n_samples) that contains the joint probabilities between the points given.
+        In single precision if dists is, and condensed if dists is.
+
+    betas : ndarray of shape (n_samples,). Only returned if return_betas is True.
     """
+    if backend=="numba":
+        from . import kernels
+        result, betas = kernels.joint_probabilities_gaussian(dists, perplexity, tolerance, search_iters)
+        return (result, betas) if return_betas else result
+    if dists.ndim==1:
+        result, deviations = __joint_p_condensed(dists, perplexity, tolerance, search_iters)
+        return (result, 1/(2*np.square(deviations))) if return_betas else result
     n = dists.shape[0]
     not_diag = ~np.eye(n, dtype=bool)
-    cond_probs = np.zeros_like(dists, dtype=np.float64)
+    cond_probs = np.zeros_like(dists, dtype=np.float32 if dists.dtype==np.float32 else np.float64)
+    deviations = np.zeros(n, dtype=np.float64)
+    for i in range(n):
+        cond_probs[i], deviations[i] = __search_cond_p(dists[i:i+1,:], perplexity, tolerance, search_iters, not_diag[i:i+1,:])
+    result = (cond_probs+cond_probs.T)/(2*n)
+    if return_betas:
+        return result, 1/(2*np.square(deviations))
+    return result
+
+def __joint_p_condensed(dists, perplexity, tolerance, search_iters) -> tuple[np.ndarray, np.ndarray]:
+    n = n_samples_of(dists)
+    offsets = condensed_offsets(n)
+    result = np.zeros_like(dists, dtype=np.float32 if dists.dtype==np.float32 else np.float64)
+    deviations = np.zeros(n, dtype=np.float64)
+    not_diag = np.ones((1, n), dtype=bool)
     for i in range(n):
-        cond_probs[i] = __search_cond_p(dists[i:i+1,:], perplexity, tolerance, search_iters, not_diag[i:i+1,:])
-    return (cond_probs+cond_probs.T)/(2*n)
+        # La fila i esta repartida: pares (j, i) con j<i sueltos, y pares (i, j) con j>i contiguos
+        lower = offsets[:i] + (i-1-np.arange(i))
+        upper = slice(offsets[i], offsets[i]+n-1-i)
+        row = np.concatenate([dists[lower], [0.], dists[upper]])
+        not_diag[0, i-1] = True
+        not_diag[0, i] = False
+        cond_p, deviations[i] = __search_cond_p(row[None, :], perplexity, tolerance, search_iters, not_diag)
+        result[lower] += cond_p[:i]
+        result[upper] += cond_p[i+1:]
+    result /= 2*n
+    return result, deviations
+
+def n_samples_of(P) -> int:
+    """Returns the number of samples of a square matrix, or of the condensed form of one.
+    """
+    if np.ndim(P)==1:
+        return int(round((1+np.sqrt(1+8*len(P)))/2))
+    return P.shape[0]
+
+def condensed_offsets(n:int) -> np.ndarray:
+    """Returns the position in the condensed form of a (n, n) matrix of the first pair (i, i+1) of each row i.
+
+    The pairs (i, j) with j>i of row i are stored contiguously from there.
+    """
+    i = np.arange(n, dtype=np.int64)
+    return n*i - i*(i+1)//2
 
 #Deviations
 def __search_cond_p(dist, goal, tolerance, iters, not_diag, *, min_deviation=1e-20, max_deviation=1e5) -> float:
@@ -74,7 +187,7 @@ def __search_cond_p(dist, goal, tolerance, iters, not_diag, *, min_deviation=1e-
         else:
             min_deviation = new_deviation
         i+=1
-    return p[0]
+    return p[0], new_deviation
 
 #Perplexity
 def __perplexity(cond_p:np.ndarray) -> np.ndarray:
@@ -90,59 +203,327 @@ def __conditional_p(distances:np.ndarray, sigmas, not_diag) -> np.ndarray:
         aux[0][indice]=0.
     else:
         np.fill_diagonal(aux, 0.)
-    return aux / aux.sum(axis=1, where=not_diag)
+    return aux / aux.sum(axis=1, where=not_diag, dtype=np.float64)
 
-#===Joint Probabilities (T-Student)========================================
-def joint_probabilities_student(distances:np.ndarray)-> np.ndarray:
-    """Obtain the joint probabilities q.
+#===Conditional Probabilities (Nearest Neighbors)==========================
+def conditional_probabilities_knn(dists:np.ndarray, perplexity:int, tolerance:float=0., search_iters=200, *, betas=None, backend="numpy") -> tuple[np.ndarray, np.ndarray]:
+    """Obtain the conditional probabilities of each point with respect to its nearest neighbors.
+
+    The precision of the gaussian of every point is searched at the same time.
 
     Parameters
     ----------
-    distances : ndarray of shape (n_samples, n_samples)
-        An array with the distances between the different points. The distances must be calculated without performing the square root
+    dists : ndarray of shape (n_samples, n_neighbors)
+        The distances from each point to its nearest neighbors, without performing the square root.
+        The point itself must not be included among its neighbors.
+
+    perplexity : float
+        Goal perplexity value.
+    
+    tolerance : float, default = 0.
+        Acceptable perplexities will be in the range [perplexity-tolerance, perplexity+tolerance].
+        Note: If 0, the search runs for search_iters iterations
+    
+    search_iters : int, default = 200
+        Maximum number of iterations of search for the value of each beta
+    
+    betas : None or ndarray of shape (n_samples,), default = None
+        Starting value of the precision of each gaussian, beta=1/(2*sigma^2).
+        A good guess, like the precision of a nearby point, shortens the search.
+        If None, the search starts at 1/median(dists) for every point.
+    
+    backend : str, default = 'numpy'
+        If 'numba', the compiled kernel of animatsne.kernels is used.
 
     Returns
     -------
-    probabilities : ndarray of shape (n_samples, n_samples) that contains the joint probabilities between the points given.
+    probabilities : ndarray of shape (n_samples, n_neighbors) with the conditional probability of each neighbor.
+
+    betas : ndarray of shape (n_samples,) with the precision found for each point.
     """
-    d = 1/(1+distances)
-    return d/(d.sum()-d.trace())
+    if backend=="numba":
+        from . import kernels
+        return kernels.conditional_probabilities_knn(dists, perplexity, tolerance, search_iters, betas=betas)
+    dists = np.asarray(dists, dtype=np.float64)
+    n = dists.shape[0]
+    # Restar la menor distancia no cambia las probabilidades, pero evita que todas se anulen
+    dists = dists - dists.min(axis=1, keepdims=True)
+    if betas is None:
+        betas = 1/np.maximum(np.median(dists, axis=1), np.finfo(float).tiny)
+    betas = np.array(betas, dtype=np.float64)
+    beta_min = np.zeros(n)
+    beta_max = np.full(n, np.inf)
+    pending = np.ones(n, dtype=bool)
+    for _ in range(search_iters):
+        p = np.exp(-dists[pending]*betas[pending, None])
+        p /= p.sum(axis=1, keepdims=True)
+        perp = __perplexity(p) if p.shape[0]>1 else np.atleast_1d(__perplexity(p))
+        diff = perp - perplexity
 
-#===Nearest Neighbors===================================================
-def __get_neighbor_ranking_by_distance_safe(distances) -> np.ndarray:
-    if distances.shape.ndim!=2 or len(distances) != distances.shape[1]:
-        raise ValueError("distances must be a square 2D array")
-    
-    n = distances.shape[0]
-    neighbors = distances.shape[1]
+        converged = np.abs(diff)<=abs(tolerance)
+        idx = np.flatnonzero(pending)
+        # Perplejidad demasiado alta: gaussiana demasiado ancha, aumentar beta
+        high = diff>0
+        beta_min[idx[high]] = betas[idx[high]]
+        beta_max[idx[~high]] = betas[idx[~high]]
+        new = np.where(np.isinf(beta_max[idx]), betas[idx]*2, (beta_min[idx]+beta_max[idx])/2)
+        betas[idx[~converged]] = new[~converged]
+        pending[idx[converged]] = False
+        if not pending.any():
+            break
+    p = np.exp(-dists*betas[:, None])
+    p /= p.sum(axis=1, keepdims=True)
+    return p, betas
 
-    result = np.ones_like(distances).astype(int)
-    indices_sorted = np.argsort(distances, axis=1)
+def joint_probabilities_knn(cond_probs:np.ndarray, neighbors:np.ndarray):
+    """Obtain the sparse joint probabilities from the conditional probabilities of each point's nearest neighbors.
 
-    #recorrer los individuos
-    for i in range(n):
-        for rank in range(neighbors):
-            j = indices_sorted[i][rank]
-            result[i][j] = rank+1
-    return result
+    Parameters
+    ----------
+    cond_probs : ndarray of shape (n_samples, n_neighbors)
+        The conditional probabilities of the neighbors of each point, as returned by conditional_probabilities_knn.
 
-def __get_neighbor_ranking_by_distance_fast(distances) -> np.ndarray:
-    if distances.shape.ndim!=2 or len(distances) != distances.shape[1]:
-        raise ValueError("distances must be a square 2D array")
+    neighbors : ndarray of shape (n_samples, n_neighbors)
+        The indices of the neighbors of each point.
 
-    result = np.ones_like(distances).astype(int)
-    indices_sorted = np.argsort(distances, axis=1)
+    Returns
+    -------
+    probabilities : scipy.sparse.csr_matrix of shape (n_samples, n_samples) that contains the joint probabilities.
+    """
+    from scipy import sparse
+    n, k = neighbors.shape
+    cond = sparse.csr_matrix((cond_probs.ravel(), neighbors.ravel(), np.arange(0, n*k+1, k)), shape=(n, n))
+    return ((cond+cond.T)/(2*n)).tocsr()
 
-    filas, columnas = np.indices(distances.shape)
+#===Nearest Neighbors Index================================================
+def knn_forest_add(forest:list, X:np.ndarray, start:int) -> list:
+    """Add the samples X[start:] to a nearest neighbors index made of several kd-trees.
 
-    result[filas, indices_sorted] += columnas
-    
-    return result
+    Each tree covers a contiguous range of samples. The trees are merged so that each one
+    is at least twice as big as the next, which keeps the number of trees logarithmic while
+    adding a batch of samples only rebuilds, on average, a number of samples proportional to the batch.
 
-def __get_is_neighbor(distances:np.ndarray, n_neighbors):
-    result = np.zeros(shape=distances.shape, dtype=bool)
-    filas = np.array([1 for _ in range(len(n_neighbors))], dtype=int)
-    indices_neighbors = np.argsort(distances, axis=1)[:,:n_neighbors]
-    for i in range(len(result)):
-        result[filas*i, indices_neighbors[i]] = True
-    return result
+    Parameters
+    ----------
+    forest : list of tuple(int, scipy.spatial.cKDTree)
+        The current index, as a list of (first sample, tree). It may be empty.
+
+    X : ndarray of shape (n_samples, n_features)
+        All the samples of the index, including the new ones.
+
+    start : int
+        Index of the first new sample.
+
+    Returns
+    -------
+    forest : list of tuple(int, scipy.spatial.cKDTree)
+        The updated index.
+    """
+    from scipy.spatial import cKDTree
+    forest = list(forest)
+    forest.append((start, cKDTree(X[start:])))
+    while len(forest)>1 and forest[-2][1].n<=2*forest[-1][1].n:
+        first, _ = forest[-2]
+        forest[-2:] = [(first, cKDTree(X[first:]))]
+    return forest
+
+def knn_forest_query(forest:list, X:np.ndarray, k:int, *, query_indices:np.ndarray=None) -> tuple[np.ndarray, np.ndarray]:
+    """Find the nearest neighbors of X among the samples of a kd-tree index.
+
+    Parameters
+    ----------
+    forest : list of tuple(int, scipy.spatial.cKDTree)
+        The index, as returned by knn_forest_add.
+
+    X : ndarray of shape (n_queries, n_features)
+        The samples to find the neighbors of.
+
+    k : int
+        Number of neighbors.
+
+    query_indices : None or ndarray of shape (n_queries,), default=None
+        If the queried samples are themselves in the index, their indices, so that
+        they are not returned as their own neighbors.
+
+    Returns
+    -------
+    distances : ndarray of shape (n_queries, k)
+        The distances to the neighbors, without performing the square root, in ascending order.
+
+    neighbors : ndarray of shape (n_queries, k)
+        The indices of the neighbors.
+    """
+    extra = 0 if query_indices is None else 1
+    dists, neighbors = [], []
+    for first, tree in forest:
+        k_tree = min(k+extra, tree.n)
+        d, i = tree.query(X, k=k_tree)
+        dists.append(np.reshape(d, (len(X), k_tree)))
+        neighbors.append(np.reshape(i, (len(X), k_tree))+first)
+    dists = np.hstack(dists)
+    neighbors = np.hstack(neighbors)
+    if query_indices is not None:
+        dists[neighbors==np.reshape(query_indices, (-1, 1))] = np.inf
+    order = np.argsort(dists, axis=1)[:, :k]
+    return np.square(np.take_along_axis(dists, order, axis=1)), np.take_along_axis(neighbors, order, axis=1)
+
+def knn_precomputed(dists:np.ndarray, k:int, *, block_size=1024) -> tuple[np.ndarray, np.ndarray]:
+    """Find the nearest neighbors of each sample in a square matrix of distances, by blocks of rows.
+
+    Parameters
+    ----------
+    dists : ndarray of shape (n_samples, n_samples)
+        The distances between the samples, without performing the square root.
+
+    k : int
+        Number of neighbors. The sample itself is not returned as its own neighbor.
+
+    block_size : int, default=1024
+        Number of rows searched at the same time.
+
+    Returns
+    -------
+    distances : ndarray of shape (n_samples, k)
+        The distances to the neighbors, in ascending order.
+
+    neighbors : ndarray of shape (n_samples, k)
+        The indices of the neighbors.
+    """
+    n = dists.shape[0]
+    result_dists = np.empty((n, k))
+    result_neighbors = np.empty((n, k), dtype=np.intp)
+    for start in range(0, n, block_size):
+        stop = min(start+block_size, n)
+        block = np.array(dists[start:stop], dtype=np.float64)
+        block[np.arange(stop-start), np.arange(start, stop)] = np.inf
+        neighbors = np.argpartition(block, k-1, axis=1)[:, :k]
+        block = np.take_along_axis(block, neighbors, axis=1)
+        order = np.argsort(block, axis=1)
+        result_dists[start:stop] = np.take_along_axis(block, order, axis=1)
+        result_neighbors[start:stop] = np.take_along_axis(neighbors, order, axis=1)
+    return result_dists, result_neighbors
+
+def knn_blocked(X, k:int, *, block_size=2048, group_size=None, dtype=None) -> tuple[np.ndarray, np.ndarray]:
+    """Find the nearest neighbors of each sample by brute force, comparing blocks of samples.
+
+    The rows are processed in groups of several blocks, kept in floating point, and every block of
+    columns is read once per group and compared with each block of the group. So X is read
+    n_samples/group_size times, and can be an integer array or a memory-mapped file bigger than
+    the available memory. The cost is O(n_samples^2*n_features).
+
+    Parameters
+    ----------
+    X : array-like of shape (n_samples, n_features)
+        The samples. It is read by blocks of rows.
+
+    k : int
+        Number of neighbors. The sample itself is not returned as its own neighbor.
+
+    block_size : int, default=2048
+        Number of rows of each block. The distances between two blocks are kept in memory.
+
+    group_size : int or None, default=None
+        Number of rows of each group, rounded up to a multiple of block_size.
+        If None, as many as fit in about 256MB in floating point.
+
+    dtype : None or data-type, default=None
+        If np.float32, the distances are computed in single precision.
+        Otherwise, in double precision.
+
+    Returns
+    -------
+    distances : ndarray of shape (n_samples, k)
+        The distances to the neighbors, without performing the square root, in ascending order.
+
+    neighbors : ndarray of shape (n_samples, k)
+        The indices of the neighbors.
+    """
+    dtype = np.float32 if dtype is not None and np.dtype(dtype)==np.float32 else np.float64
+    n = len(X)
+    if group_size is None:
+        group_size = 2**28//max(1, np.prod(np.shape(X)[1:], dtype=int)*np.dtype(dtype).itemsize)
+    group_size = block_size*max(1, -(-group_size//block_size))
+    result_dists = np.full((n, k), np.inf)
+    result_neighbors = np.zeros((n, k), dtype=np.intp)
+    for group_start in range(0, n, group_size):
+        group_stop = min(group_start+group_size, n)
+        starts = range(group_start, group_stop, block_size)
+        rows = {start: np.asarray(X[start:min(start+block_size, group_stop)], dtype=dtype) for start in starts}
+        for col_start in range(0, n, block_size):
+            col_stop = min(col_start+block_size, n)
+            # Cada bloque de columnas se lee una vez por grupo; si es del grupo, ya esta convertido
+            cols = rows[col_start] if col_start in rows else np.asarray(X[col_start:col_stop], dtype=dtype)
+            for start in starts:
+                stop = start+len(rows[start])
+                block = pairwise_euclidean_distance_to(rows[start], cols, dtype=dtype)
+                if col_start==start:
+                    np.fill_diagonal(block, np.inf)
+                # Los k mejores de los vecinos ya encontrados y los del bloque
+                block = np.hstack([result_dists[start:stop], block])
+                neighbors = np.hstack([result_neighbors[start:stop], np.broadcast_to(np.arange(col_start, col_stop), (stop-start, col_stop-col_start))])
+                keep = np.argpartition(block, k-1, axis=1)[:, :k]
+                result_dists[start:stop] = np.take_along_axis(block, keep, axis=1)
+                result_neighbors[start:stop] = np.take_along_axis(neighbors, keep, axis=1)
+    order = np.argsort(result_dists, axis=1)
+    # Las diferencias de normas pueden dejar distancias ligeramente negativas
+    result_dists = np.maximum(np.take_along_axis(result_dists, order, axis=1), 0)
+    result_neighbors = np.take_along_axis(result_neighbors, order, axis=1)
+    return result_dists, result_neighbors
+
+def knn_insert(neighbors:np.ndarray, dists:np.ndarray, rows:np.ndarray, cols:np.ndarray, cand_dists:np.ndarray) -> np.ndarray:
+    """Insert candidate neighbors in the nearest neighbors lists of some samples, in place.
+
+    Each candidate replaces the farthest neighbors of its row if it is closer than them.
+
+    Parameters
+    ----------
+    neighbors : ndarray of shape (n_samples, k)
+        The indices of the neighbors of each sample. Updated in place.
+
+    dists : ndarray of shape (n_samples, k)
+        The distances to the neighbors of each sample. Updated in place.
+
+    rows, cols, cand_dists : ndarray of shape (n_candidates,)
+        Each candidate is the sample cols[c], at a distance cand_dists[c] from the sample rows[c].
+
+    Returns
+    -------
+    changed : ndarray
+        The indices of the samples whose neighbors changed, in ascending order.
+    """
+    k = neighbors.shape[1]
+    closer = cand_dists<dists[rows].max(axis=1)
+    rows, cols, cand_dists = rows[closer], cols[closer], cand_dists[closer]
+    changed = np.unique(rows)
+
+    all_rows = np.concatenate([np.repeat(changed, k), rows])
+    all_cols = np.concatenate([neighbors[changed].ravel(), cols])
+    all_dists = np.concatenate([dists[changed].ravel(), cand_dists])
+    order = np.lexsort((all_dists, all_rows))
+    all_rows, all_cols, all_dists = all_rows[order], all_cols[order], all_dists[order]
+    rank = np.arange(len(all_rows)) - np.searchsorted(all_rows, all_rows)
+    keep = rank<k
+    neighbors[changed] = all_cols[keep].reshape(len(changed), k)
+    dists[changed] = all_dists[keep].reshape(len(changed), k)
+    return changed
+
+#===Joint Probabilities (T-Student)========================================
+def joint_probabilities_student(distances:np.ndarray)-> np.ndarray:
+    """Obtain the joint probabilities q.
+
+    Parameters
+    ----------
+    distances : ndarray of shape (n_samples, n_samples) or (n_samples*(n_samples-1)/2,)
+        An array with the distances between the different points. The distances must be calculated without performing the square root
+        If condensed, each pair is computed once and the probabilities are returned condensed too.
+
+    Returns
+    -------
+    probabilities : ndarray of shape (n_samples, n_samples) that contains the joint probabilities between the points given.
+    """
+    d = 1/(1+distances)
+    if d.ndim==1:
+        d /= 2*d.sum(dtype=np.float64)
+    else:
+        d /= d.sum(dtype=np.float64)-d.trace(dtype=np.float64)
+    return d
@@ -0,0 +1,196 @@
+import numpy as np
+import os
+import tempfile
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+from scipy import sparse
+from . import anim, kernels
+
+# Parametros que cambian P: no pueden variar entre las configuraciones de un mismo barrido
+_AFFINITY_PARAMS = ["perplexity", "perplexity_tolerance", "metric", "engine"]
+
+def sweep(input, configs, *, params=None, labels=None, n_jobs=None, record_embed=False, animate=False, gif_filename=None, gif_kwargs=None) -> list[dict]:
+    """Run the descent of t-SNE with several configurations of the optimizer on the same data.
+
+    P is computed only once and shared with the worker processes through a memory-mapped file.
+    Every configuration starts from the same initial embedding.
+
+    Parameters
+    ----------
+    input : array-like of shape (n_samples, n_features).
+        The data to fit.
+
+    configs : dict of lists or list of dicts
+        The configurations to run, as keyword arguments of TSne.
+        If a dict of lists, every combination of its values is run.
+        They cannot change the parameters that P depends on: perplexity, perplexity_tolerance, metric and engine,
+        nor init, since every configuration starts from the same initial embedding, computed from params.
+
+    params : None or dict, default=None
+        Keyword arguments of TSne shared by every configuration.
+
+    labels : None or array-like of shape (n_samples,), default=None
+        Array with the labels to assign each sample in the animation.
+
+    n_jobs : int or None, default=None
+        Number of worker processes. If None, the number of processors of the machine.
+        With the numba backend, or once any compiled kernel has run in the calling process,
+        they are started with 'spawn', so the script that calls sweep must run it inside
+        an if __name__=="__main__": block.
+
+    record_embed : boolean, default=False
+        If True, the embedding of every iteration of each configuration is returned.
+        It is needed to animate the results.
+
+    animate : boolean, default=False
+        If True, the descents are displayed side by side in a grid of small multiples.
+
+    gif_filename : str or None, default=None
+        If animate is True, the file to output the animation to.
+        If None, the animation is displayed once.
+
+    gif_kwargs : dict
+        Additional keyword arguments for the gif save method.
+
+    Returns
+    -------
+    results : list of dict
+        One row per configuration, in the same order, with the configuration and the keys
+        'cost' (final cost), 'best_cost', 'best_iter', 'n_iter', 'cost_record', 'history'
+        (the records of TSne.history), 'init_embed', 'embed' and, if record_embed is True, 'embedding_record'.
+    """
+    params = {} if params is None else dict(params)
+    if isinstance(configs, dict):
+        configs = [dict(zip(configs.keys(), values)) for values in itertools.product(*configs.values())]
+    configs = [dict(c) for c in configs]
+    assert len(configs)>0, "configs must contain at least one configuration"
+    for c in configs:
+        changed = [k for k in _AFFINITY_PARAMS if k in c]
+        assert len(changed)==0, "The configurations cannot change the parameters of P: {}".format(changed)
+        assert "init" not in c, "The configurations cannot change init: every one starts from the same initial embedding, set it in params"
+    if animate:
+        record_embed = True
+
+    model = anim.TSne(**params)
+    p, init = model._prepare(input, labels)
+
+    results = _run_shared(p, [{**params, **c, "init": init, "engine": model.engine_used} for c in configs], n_jobs=n_jobs, record_embed=record_embed)
+    for c, r in zip(configs, results):
+        r.update(c)
+
+    if animate:
+        titles = [", ".join("{}={}".format(k, v) for k, v in c.items()) for c in configs]
+        animate_grid([r["embedding_record"] for r in results], titles, colors=model._plotting_colors, gif_filename=gif_filename, gif_kwargs=gif_kwargs)
+    return results
+
+def _run_shared(p, param_list, *, n_jobs=None, record_embed=False) -> list[dict]:
+    # P se escribe una vez en disco y cada proceso lo abre como memmap de solo lectura.
+    # Si es dispersa, se guardan sus tres arrays por separado
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if sparse.issparse(p):
+            p = p.tocsr()
+            p_path = {"shape": p.shape}
+            for name in ["data", "indices", "indptr"]:
+                p_path[name] = os.path.join(tmp_dir, "p_{}.npy".format(name))
+                np.save(p_path[name], getattr(p, name))
+        else:
+            p_path = os.path.join(tmp_dir, "p.npy")
+            np.save(p_path, p)
+        # El pool de hilos de numba no sobrevive a un fork: si ya arranco en este proceso (con cualquier kernel compilado
+        # ejecutado antes, como los de backend='auto'), o si lo van a usar los procesos, se usa 'spawn'.
+        # Si no, el contexto por defecto, que no obliga a proteger el script con if __name__=="__main__":
+        numba = kernels.launched() or (kernels.available() and any(params.get("backend", "auto").lower()!="numpy" for params in param_list))
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn" if numba else None)) as pool:
+            futures = [pool.submit(_worker, p_path, params, record_embed) for params in param_list]
+            return [f.result() for f in futures]
+
+def _load_shared(p_path):
+    if isinstance(p_path, dict):
+        arrays = [np.load(p_path[name], mmap_mode="r") for name in ["data", "indices", "indptr"]]
+        return sparse.csr_matrix(tuple(arrays), shape=p_path["shape"], copy=False)
+    return np.load(p_path, mmap_mode="r")
+
+def _worker(p_path, params, record_embed) -> dict:
+    p = _load_shared(p_path)
+    model = anim.TSne(**params)
+    embed = model._descend(p, record_embed=record_embed, record_cost=True)
+    best_cost, best_iter = model.get_best_embed_info()
+    result = {
+        "cost": model._cost(p),
+        "best_cost": best_cost,
+        "best_iter": best_iter,
+        "n_iter": model.n_iter,
+        "cost_record": model.cost_record,
+        "history": model.history.records.copy(),
+        "embed": embed,
+        "init_embed": model._init_embed,
+        "update": model._update,
+        "gains": model._gains,
+    }
+    if record_embed:
+        result["embedding_record"] = model.embedding_record
+    return result
+
+#===Small multiples========================================================
+def animate_grid(records, titles, *, colors=None, size=5, ncols=None, gif_filename=None, gif_kwargs=None):
+    """Display several recorded embedding processes side by side, one per subplot.
+
+    Only the first 2 dimensions of each embedding are displayed.
+
+    Parameters
+    ----------
+    records : list of list[ndarray]
+        The embedding of every iteration of each process, like TSne.embedding_record.
+
+    titles : list of str
+        The title of each subplot.
+
+    colors : None or array-like of shape (n_samples,), default=None
+        The color of each sample.
+
+    size : int, default=5
+        The size of the markers.
+
+    ncols : int or None, default=None
+        Number of columns of the grid. If None, the grid is as square as possible.
+
+    gif_filename : str or None, default=None
+        The file to output the animation to.
+        If None, the animation is displayed once.
+
+    gif_kwargs : dict
+        Additional keyword arguments for the gif save method.
+    """
+    n = len(records)
+    ncols = int(np.ceil(np.sqrt(n))) if ncols is None else ncols
+    nrows = int(np.ceil(n/ncols))
+    fig, axes = plt.subplots(nrows, ncols, figsize=(3*ncols, 3*nrows), squeeze=False)
+    scatters = []
+    for ax, record, title in zip(axes.flat, records, titles):
+        scatters.append(ax.scatter(record[0].T[0], record[0].T[1], c=colors, s=size))
+        ax.set_title(title, fontsize="small")
+        ax.set_xticks([])
+        ax.set_yticks([])
+    for ax in axes.flat[n:]:
+        ax.set_axis_off()
+    n_frames = max(len(r) for r in records)
+
+    def update(i):
+        for ax, scatter, record in zip(axes.flat, scatters, records):
+            embed = record[min(i, len(record)-1)][:, :2]
+            scatter.set_offsets(embed)
+            low, high = embed.min(axis=0), embed.max(axis=0)
+            margin = 0.05*np.maximum(high-low, np.finfo(float).eps)
+            ax.set_xlim(low[0]-margin[0], high[0]+margin[0])
+            ax.set_ylim(low[1]-margin[1], high[1]+margin[1])
+        fig.suptitle("Iteration: {}/{}".format(i, n_frames-1))
+        return scatters
+
+    ani = animation.FuncAnimation(fig, update, n_frames, interval=100, repeat=False)
+    if gif_filename is None:
+        plt.show()
+    else:
+        ani.save(gif_filename, **({} if gif_kwargs is None else gif_kwargs))
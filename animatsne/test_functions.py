@@ -1,7 +1,9 @@
+import os
 import numpy as np
 # import tests.comparacion as comp
 # import tests.utils as ut
 from tests import comparacion, utils
+from animatsne import datasets
 import gc
 
 #=================================================================#
@@ -9,8 +11,13 @@ n_type = np.int16
 first_column = True
 skip_start = True
 usar_rutas_fragmentadas = True
+# Sin los csv de MNIST se usa una mezcla sintetica parecida
+usar_datos_sinteticos = not os.path.isfile("tests/data/mnist_test.csv")
 #-----------------------------------------------------------------
-if usar_rutas_fragmentadas:
+if usar_datos_sinteticos:
+    data_full, labels_full = datasets.make_mnist_like(70000, dtype=n_type, seed=0)
+    data_train, labels_train, data_test, labels_test = data_full[:60000], labels_full[:60000], data_full[60000:], labels_full[60000:]
+elif usar_rutas_fragmentadas:
     routes_train = ["tests/data/mnist_train_p{}.csv".format(i) for i in range(7)]
     data_train, labels_train = utils.read_csv(routes_train, labels_in_first_column=first_column, num_type=n_type, skip_start_row=skip_start)
     data_test, labels_test = utils.read_csv("tests/data/mnist_test.csv", labels_in_first_column=first_column, num_type=n_type, skip_start_row=skip_start)
@@ -46,7 +53,7 @@ parametros_train = [data_entrenamiento, labels_entrenamiento]
 parametros_print = {
     "display": True,
     "print_tiempo": True,
-    "trust": n_samples<=40000,
+    "trust": True,
 }
 
 if n_samples>5000:
@@ -59,6 +66,12 @@ match caso_prueba:
     case "mio":
         parametros_print["title"] = string_titulo.format("animatsne", n_samples)
         comparacion.probar_mio(*parametros_train, **parametros_print)
+    case "gains":
+        comparacion.probar_gains(*parametros_train, print_tiempo=True)
+    case "dtype":
+        comparacion.probar_dtype(*parametros_train, print_tiempo=True)
+    case "sequence":
+        comparacion.probar_sequence(*parametros_train, print_tiempo=True)
     case "skl":
         parametros_print["title"] = string_titulo.format("scikit-learn", n_samples)
         comparacion.probar_sklearn(*parametros_train, **parametros_print)
@@ -0,0 +1,248 @@
+"""Reproducible benchmarks of the engines of animatsne on synthetic data.
+
+Every case of the grid (n_samples, n_features, perplexity, engine) is timed in three stages:
+
+- 'affinities': validation of the input and computation of P, as fit does.
+- 'gradient': the iterations of the descent on that P, without displaying them.
+- 'animation': drawing and encoding the frames of a short fit into a gif.
+
+For each stage the wall time and the throughput are reported and, for the first two, the peak memory traced by tracemalloc.
+The results are stored in benchmarks/<version>.json, so the ones of two versions can be compared:
+
+    python -m tests.benchmark --quick
+    python -m tests.benchmark --compare 1.0.0
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+from animatsne import anim, datasets, engines
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "benchmarks")
+
+GRID = {
+    "n_samples": [1000, 5000, 20000],
+    "n_features": [50, 784],
+    "perplexity": [30.],
+    "engine": ["exact", "sparse", "fft", "sampling"],
+}
+QUICK_GRID = {
+    "n_samples": [500, 2000],
+    "n_features": [50],
+    "perplexity": [30.],
+    "engine": ["exact", "sparse", "fft", "sampling"],
+}
+
+def get_version() -> str:
+    """The version of the installed package or, if it is not installed, the one in pyproject.toml.
+    """
+    from importlib import metadata
+    try:
+        return metadata.version("animatsne")
+    except metadata.PackageNotFoundError:
+        # tomllib solo existe desde Python 3.11: basta con la linea version de la seccion [project]
+        with open(os.path.join(os.path.dirname(__file__), "..", "pyproject.toml")) as f:
+            project = f.read().split("[project]", 1)[-1].split("\n[", 1)[0]
+        return re.search(r'^version\s*=\s*["\']([^"\']+)["\']', project, re.MULTILINE).group(1)
+
+def _measure(function, *, repeat=1, memory=True):
+    # El tiempo, el menor de repeat ejecuciones, se mide sin tracemalloc, que hace mucho mas lento el codigo con muchas
+    # reservas pequeñas (como matplotlib), y el pico de memoria de numpy/Python en otra ejecucion (los kernels compilados no se registran)
+    seconds = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = function()
+        seconds = min(seconds, time.perf_counter()-t0)
+    if not memory:
+        return result, seconds, None
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if started:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+def run_case(n_samples, n_features, perplexity, engine, *, n_iter=100, n_frames=10, repeat=3, animate=True, memory=True, seed=0, memory_limit=None) -> dict:
+    """Benchmark one case of the grid.
+
+    Parameters
+    ----------
+    n_samples, n_features, perplexity, engine
+        The case to run. The data is generated by datasets.make_blobs with the given seed.
+
+    n_iter : int, default=100
+        Number of iterations of the descent timed in the 'gradient' stage.
+
+    n_frames : int, default=10
+        Number of iterations, and frames, of the fit timed in the 'animation' stage.
+
+    repeat : int, default=3
+        Number of times the 'affinities' and 'gradient' stages are run. The shortest time is reported.
+
+    animate : boolean, default=True
+        If False, the 'animation' stage is skipped.
+
+    memory : boolean, default=True
+        If True, the 'affinities' and 'gradient' stages are run a second time with tracemalloc to find their peak memory.
+        The 'animation' stage is only timed: tracemalloc makes matplotlib several times slower.
+
+    seed : int, default=0
+        Seed of the data and of the models.
+
+    memory_limit : int, float or None, default=None
+        Passed to TSne. The cases whose engine needs more memory are skipped.
+
+    Returns
+    -------
+    result : dict
+        The case and, for each stage run, a dict with the keys 'seconds', 'throughput' (samples per second
+        for 'affinities', iterations per second for 'gradient' and frames per second for 'animation')
+        and 'peak_memory' (bytes, or None if not measured). If the case was skipped, the key 'skipped' with the reason.
+    """
+    result = {"n_samples": n_samples, "n_features": n_features, "perplexity": perplexity, "engine": engine}
+    X, labels = datasets.make_blobs(n_samples, n_features, seed=seed)
+    params = {"perplexity": perplexity, "engine": engine, "seed": seed, "memory_limit": memory_limit}
+    try:
+        (p, init), seconds, peak = _measure(lambda: anim.TSne(**params)._prepare(X), repeat=repeat, memory=memory)
+    except MemoryError as e:
+        result["skipped"] = str(e)
+        return result
+    result["affinities"] = {"seconds": seconds, "throughput": n_samples/seconds, "peak_memory": peak}
+
+    # El coste solo se calcula al final para que el tiempo sea el de las iteraciones
+    def descend():
+        model = anim.TSne(**params, init=init, n_iter=n_iter, momentum_threshold=n_iter//2, iters_check=n_iter)
+        model._descend(p)
+        return model
+    model, seconds, peak = _measure(descend, repeat=repeat, memory=memory)
+    gradient = model.timings_["gradient"]
+    result["gradient"] = {"seconds": seconds, "throughput": model.n_iter/seconds, "peak_memory": peak,
+                          "seconds_per_iteration": gradient["seconds"]/gradient["calls"]}
+    del p
+
+    if animate:
+        model = anim.TSne(**params, n_iter=n_frames, momentum_threshold=n_frames//2, iters_check=n_frames)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _, seconds, _ = _measure(lambda: model.fit(X, labels, gif_filename=os.path.join(tmp_dir, "bench.gif"), gif_kwargs={"writer": "pillow"}), memory=False)
+        rendering = model.timings_["rendering"]["seconds"]
+        encoding = model.timings_["encoding"]["seconds"]
+        result["animation"] = {"seconds": seconds, "throughput": n_frames/(rendering+encoding), "peak_memory": None,
+                               "rendering": rendering, "encoding": encoding}
+    return result
+
+def run(grid=None, *, verbose=True, **kwargs) -> list[dict]:
+    """Benchmark every combination of the values of grid, a dict of lists like GRID.
+
+    **kwargs are passed to run_case.
+    """
+    grid = GRID if grid is None else grid
+    # Una ejecucion pequeña por motor antes de medir: importaciones y compilacion de los kernels
+    for engine in grid["engine"]:
+        run_case(200, 10, 30., engine, n_iter=10, repeat=1, animate=False, memory=False)
+    results = []
+    for values in itertools.product(*grid.values()):
+        case = dict(zip(grid.keys(), values))
+        results.append(run_case(**case, **kwargs))
+        if verbose:
+            print_result(results[-1])
+    return results
+
+def print_result(result):
+    case = "n={n_samples:>6} d={n_features:>4} perplexity={perplexity:>5} {engine:>8}".format(**result)
+    if "skipped" in result:
+        print("{}: skipped ({})".format(case, result["skipped"]))
+        return
+    stages = []
+    for stage, unit in [("affinities", "samples/s"), ("gradient", "it/s"), ("animation", "frames/s")]:
+        if stage in result:
+            r = result[stage]
+            memory = "" if r["peak_memory"] is None else " {:.1f} MB".format(r["peak_memory"]/2**20)
+            stages.append("{} {:.3f}s {:.1f} {}{}".format(stage, r["seconds"], r["throughput"], unit, memory))
+
+    print("{}: {}".format(case, " | ".join(stages)))
+
+def save(results, version=None, path=None) -> str:
+    """Store the results with the version and the machine they were run on. Returns the path of the file.
+
+    If path is None, benchmarks/<version>.json is used.
+    """
+    version = get_version() if version is None else version
+    path = os.path.join(RESULTS_DIR, "{}.json".format(version)) if path is None else path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    document = {
+        "version": version,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": sys.version.split()[0], "numpy": np.__version__, "platform": platform.platform(),
+                    "processor": platform.processor(), "cpu_count": os.cpu_count()},
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=1)
+    return path
+
+def load(version_or_path) -> dict:
+    path = version_or_path if os.path.isfile(version_or_path) else os.path.join(RESULTS_DIR, "{}.json".format(version_or_path))
+    with open(path) as f:
+        return json.load(f)
+
+def compare(baseline, current, *, threshold=1.25, verbose=True) -> list[dict]:
+    """Compare the results of two versions, as returned by load or run.
+
+    Returns a row per case and stage run in both, with the ratio of the times current/baseline,
+    and the key 'regression' set when it is greater than threshold.
+    """
+    def key(r):
+        return (r["n_samples"], r["n_features"], r["perplexity"], r["engine"])
+    baseline = {key(r): r for r in (baseline["results"] if isinstance(baseline, dict) else baseline)}
+    current = current["results"] if isinstance(current, dict) else current
+    rows = []
+    for r in current:
+        old = baseline.get(key(r))
+        if old is None:
+            continue
+        for stage in ["affinities", "gradient", "animation"]:
+            if stage in r and stage in old:
+                ratio = r[stage]["seconds"]/old[stage]["seconds"]
+                memory_ratio = None if None in (r[stage]["peak_memory"], old[stage]["peak_memory"]) else r[stage]["peak_memory"]/max(old[stage]["peak_memory"], 1)
+                rows.append({"case": key(r), "stage": stage, "ratio": ratio, "memory_ratio": memory_ratio, "regression": ratio>threshold})
+    if verbose:
+        for row in rows:
+            memory = "" if row["memory_ratio"] is None else ", x{:.2f} memory".format(row["memory_ratio"])
+            print("{} {:>10}: x{:.2f} time{}{}".format(row["case"], row["stage"], row["ratio"], memory, "  <-- REGRESSION" if row["regression"] else ""))
+    return rows
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="run the small grid")
+    parser.add_argument("--engines", nargs="+", choices=engines.ENGINES, help="only run these engines")
+    parser.add_argument("--n-iter", type=int, default=100, help="iterations of the 'gradient' stage")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each stage, the shortest is reported")
+    parser.add_argument("--no-animation", action="store_true", help="skip the 'animation' stage")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure the peak memory")
+    parser.add_argument("--memory-limit", type=float, default=None, help="skip the cases that need more bytes")
+    parser.add_argument("--version", default=None, help="name the results are stored with (default: the package version)")
+    parser.add_argument("--compare", default=None, help="version or file of the results to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25, help="ratio of the times considered a regression")
+    args = parser.parse_args()
+
+    grid = dict(QUICK_GRID if args.quick else GRID)
+    if args.engines is not None:
+        grid["engine"] = args.engines
+    results = run(grid, n_iter=args.n_iter, repeat=args.repeat, animate=not args.no_animation, memory=not args.no_memory, memory_limit=args.memory_limit)
+    print("Results stored in {}".format(save(results, args.version)))
+    if args.compare is not None:
+        rows = compare(load(args.compare), results, threshold=args.threshold)
+        sys.exit(1 if any(row["regression"] for row in rows) else 0)
@@ -77,6 +77,84 @@ def probar_mio(data, labels, *, display=False, title=None, print_tiempo=False, t
     del t_diff,t0
     del data_embedded,model
 
+#===Ganancias adaptativas====================================================#
+def probar_gains(data, labels, *, print_tiempo=False):
+    import animatsne.anim as anim
+
+    costes = {}
+    for gains in [False, True]:
+        argumentos = argumentos_modelo_mio.copy()
+        argumentos["adaptive_gains"] = gains
+        t0 = time.time_ns()
+        model = anim.TSne(**argumentos)
+        model.fit(data, labels, record_cost=True, gif_filename="gif-gains-{}-{}-samples.gif".format(gains, len(data)), gif_kwargs={"writer": 'imagemagick', "fps": 60})
+        t_diff = (time.time_ns()-t0)*1e-9
+        if print_tiempo:
+            ut.print_tiempo(t_diff, metodo="Mio (adaptive_gains={})".format(gains))
+        costes[gains] = model.cost_record
+        del model,t0,t_diff
+
+    # Iteracion en la que cada version alcanza el coste final sin ganancias
+    objetivo = costes[False][max(costes[False])]
+    print("============================================")
+    print("KL final sin ganancias: {:.5f}".format(objetivo))
+    for gains, record in costes.items():
+        alcanzado = [i for i, c in record.items() if i>=argumentos_modelo_mio["momentum_threshold"] and c<=objetivo]
+        print("adaptive_gains={}: KL final={:.5f}, iteraciones hasta KL<={:.5f}: {}".format(gains, record[max(record)], objetivo, min(alcanzado) if alcanzado else None))
+    print("============================================")
+
+#===Precision simple=========================================================#
+def probar_dtype(data, labels, *, print_tiempo=False, tol_kl=0.05, tol_trust=0.01):
+    import animatsne.anim as anim
+    from animatsne import metrics
+
+    resultados = {}
+    for dtype in [np.float64, np.float32]:
+        argumentos = argumentos_modelo_mio.copy()
+        argumentos["dtype"] = dtype
+        t0 = time.time_ns()
+        model = anim.TSne(**argumentos)
+        data_embedded = model.fit(data, labels, gif_filename="gif-dtype-{}-{}-samples.gif".format(np.dtype(dtype).name, len(data)), gif_kwargs={"writer": 'imagemagick', "fps": 60})
+        t_diff = (time.time_ns()-t0)*1e-9
+        if print_tiempo:
+            ut.print_tiempo(t_diff, metodo="Mio (dtype={})".format(np.dtype(dtype).name))
+        resultados[np.dtype(dtype).name] = (model.cost, metrics.trustworthiness(data, data_embedded), t_diff)
+        del model,t0,t_diff,data_embedded
+
+    # float32 debe quedar dentro de la tolerancia de float64
+    kl_64, trust_64, t_64 = resultados["float64"]
+    kl_32, trust_32, t_32 = resultados["float32"]
+    print("============================================")
+    for nombre, (kl, trust, t) in resultados.items():
+        print("{}: KL={:.5f}, trust={:.3f} %, tiempo={:.3f} s".format(nombre, kl, trust*100, t))
+    print("Diferencia relativa de KL: {:.3%} (tolerancia {:.1%}): {}".format(abs(kl_32-kl_64)/kl_64, tol_kl, abs(kl_32-kl_64)<=tol_kl*kl_64))
+    print("Diferencia de trust: {:.3f} (tolerancia {}): {}".format(abs(trust_32-trust_64), tol_trust, abs(trust_32-trust_64)<=tol_trust))
+    print("Aceleracion de float32: {:.2f}x".format(t_64/t_32))
+    print("============================================")
+
+#===Secuencia de snapshots===================================================#
+def probar_sequence(data, labels, *, n_snapshots=3, n_iter_snapshot=130, ruido=0.05, print_tiempo=False):
+    import animatsne.anim as anim
+
+    # Cada snapshot desplaza una parte de las muestras; n_iter_snapshot no es multiplo de iters_check,
+    # asi que los snapshots empiezan en iteraciones en las que no se calcula el coste
+    rng = np.random.default_rng(argumentos_modelo_mio["seed"])
+    snapshots = [np.asarray(data, dtype=float)]
+    for _ in range(n_snapshots-1):
+        siguiente = snapshots[-1].copy()
+        cambian = rng.random(len(siguiente))<0.1
+        siguiente[cambian] += ruido*np.std(siguiente)*rng.standard_normal((np.count_nonzero(cambian), siguiente.shape[1]))
+        snapshots.append(siguiente)
+
+    argumentos = argumentos_modelo_mio.copy()
+    argumentos["n_iter"] = 500
+    t0 = time.time_ns()
+    model = anim.TSne(**argumentos)
+    finales = model.fit_sequence(snapshots, labels, n_iter_snapshot=n_iter_snapshot, gif_filename="gif-sequence-{}-samples.gif".format(len(data)), gif_kwargs={"writer": 'pillow', "fps": 60})
+    if print_tiempo:
+        ut.print_tiempo((time.time_ns()-t0)*1e-9, metodo="Mio (fit_sequence)")
+    print("Snapshots: {}, iteraciones: {}, coste final: {:.5f}".format(len(finales), model.n_iter, model.cost))
+
 #===Scikit-learn=============================================================#
 def probar_sklearn(data, labels, *, display=False, title=None, print_tiempo=False, trust=False):
     if print_tiempo:
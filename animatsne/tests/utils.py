@@ -1,4 +1,7 @@
 import csv
+import io
+import os
+import hashlib
 from collections.abc import Sequence
 from matplotlib.collections import PathCollection
 import numpy as np
@@ -6,47 +9,95 @@ import matplotlib.pyplot as plt
 import gc
 
 
-def read_csv(route, *, labels_in_first_column=False, num_type=np.int8, skip_start_row=False):
-    """Read a csv file in the given route.
+def read_csv(route, *, labels_in_first_column=False, num_type=np.int8, skip_start_row=False, cache=True):
+    """Read a csv file in the given route, or several with the same columns, one after another.
+
+    The files are read in chunks of whole lines, each parsed by np.loadtxt before the next one is read,
+    so only one chunk of text is in memory at a time. The parsing is serial: the first read takes
+    as long as np.loadtxt on the whole file. The first time, the result is cached in two .npy files
+    (samples and labels) next to the first csv, which are memory-mapped on later calls while
+    the csv files do not change, so only those later calls are faster.
 
     Parameters
     ----------
-    route: str.
-        The route of the csv file to read.
+    route: str or sequence of str.
+        The route of the csv file to read, or the routes of the files to read and stack.
 
-    has_labels: boolean. default=False.
-        Wether or not the given csv has a labels column at the end.
-    
-    index_start: int. default=0.
-        Starting index of the entries to return
+    labels_in_first_column: boolean. default=False.
+        Wether the labels are in the first column of the csv. If False, they are in the last one.
+
+    num_type: data-type. default=np.int8.
+        The type of the returned arrays.
+
+    skip_start_row: boolean. default=False.
+        Wether the first row of each csv is a header to skip.
+
+    cache: boolean. default=True.
+        Wether to use, and create if needed, the .npy cache of the given routes.
 
     Returns
     ---------
-    result: tuple of 2 elements or ndarray of shape (n_samples, n_features)
-        If has_labels is set to True, this is a tuple of 2 elements, where the first is
-        a ndarray of shape (n_samples, n_features) that contains the data in the csv, and a
-        ndarray of shape (1,n_samples) with the labels corresponding to each entry in the first ndarray.
-        Otherwise, it returns the first ndarray of shape (n_samples, n_features)
+    result: tuple of 2 elements
+        The first is a ndarray of shape (n_samples, n_features) that contains the data in the csv files,
+        and the second a ndarray of shape (n_samples,) with the labels corresponding to each entry in the first one.
+        With cache=True, both are read-only memory-mapped arrays.
     """
-    start_index = 1 if skip_start_row else 0
     if isinstance(route, str):
-        data = np.loadtxt(route, num_type, delimiter=',', skiprows=start_index, ndmin=2)
+        routes = [route]
     elif isinstance(route, (Sequence, np.ndarray)):
-        data_full = []
-        for r in route:
-            data_full.append(np.loadtxt(r, num_type, delimiter=',', skiprows=start_index, ndmin=2))
-        data = np.vstack(data_full)
-        del data_full
+        routes = [str(r) for r in route]
     else:
         raise ValueError("Route must be either a str or a sequence of str")
+    num_type = np.dtype(num_type)
+
+    if cache:
+        paths = _cache_paths(routes, labels_in_first_column, num_type, skip_start_row)
+        newest = max(os.path.getmtime(r) for r in routes)
+        if all(os.path.isfile(p) and os.path.getmtime(p)>=newest for p in paths):
+            return tuple(np.load(p, mmap_mode="r") for p in paths)
+
+    parsed = [_parse_chunk(c, num_type) for r in routes for c in _read_chunks(r, skip_start_row)]
+    # Ficheros sin filas de datos (por ejemplo, solo la cabecera)
+    data = np.vstack(parsed) if len(parsed)>0 else np.empty((0, 1), dtype=num_type)
+    del parsed
     if labels_in_first_column:
-        labels = data.T[0]
-        samples = data[:,1:]
+        samples, labels = data[:, 1:], data[:, 0]
     else:
-        labels = data.T[-1]
-        samples = data[:,:-1]
-    del start_index,data; gc.collect()
-    return np.asarray(samples), np.asarray(labels)
+        samples, labels = data[:, :-1], data[:, -1]
+    samples, labels = np.ascontiguousarray(samples), np.ascontiguousarray(labels)
+    del data; gc.collect()
+
+    if cache:
+        # Se escribe en un temporal y se renombra: una ejecucion interrumpida no deja una cache a medias
+        for p, array in zip(paths, [samples, labels]):
+            with open(p+".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(p+".tmp", p)
+        return tuple(np.load(p, mmap_mode="r") for p in paths)
+    return samples, labels
+
+def _cache_paths(routes, labels_in_first_column, num_type, skip_start_row) -> list[str]:
+    # El nombre identifica los ficheros y las opciones de lectura, para no usar la cache de otra lectura
+    key = "|".join([os.path.abspath(r) for r in routes]+[str(labels_in_first_column), num_type.str, str(skip_start_row)])
+    stem = "{}.{}".format(os.path.splitext(routes[0])[0], hashlib.sha1(key.encode()).hexdigest()[:10])
+    return [stem+".data.npy", stem+".labels.npy"]
+
+def _read_chunks(route, skip_start_row, chunk_size=2**24):
+    # Trozos de unos chunk_size bytes, completados hasta el final de su ultima linea, leidos del fichero de uno en uno
+    with open(route, "rb") as f:
+        if skip_start_row:
+            f.readline()
+        while True:
+            chunk = f.read(chunk_size)
+            if len(chunk)==0:
+                return
+            chunk += f.readline()
+            if len(chunk.strip())>0:
+                yield chunk
+
+def _parse_chunk(chunk:bytes, num_type) -> np.ndarray:
+    # np.loadtxt usa el lector en C de NumPy (>=1.23)
+    return np.loadtxt(io.BytesIO(chunk), num_type, delimiter=',', ndmin=2)
 
 
 def display_embed(embed, labels, *, title=None):
@@ -92,9 +143,11 @@ def print_tiempo(t, metodo="Mio"):
     print("Execution time (s): {:.3f}".format(t))
     print("============================================")
 
-def print_trust(data, embed, metodo):
-    from sklearn import manifold
-    trust = manifold.trustworthiness(data, embed)
+def print_trust(data, embed, metodo, n_neighbors=5):
+    from animatsne import metrics
+    scores = metrics.evaluate(data, embed, n_neighbors)
+    print("============================================")
+    print("Trust con {}: {:.3f} %".format(metodo, scores["trustworthiness"]*100))
+    print("Continuity con {}: {:.3f} %".format(metodo, scores["continuity"]*100))
+    print("kNN recall con {}: {:.3f} %".format(metodo, scores["knn_recall"]*100))
     print("============================================")
-    print("Trust con {}: {:.3f} %".format(metodo, trust*100))
-    print("============================================")
\ No newline at end of file